@@ -7,12 +7,21 @@ from flask_apispec.extension import FlaskApiSpec
 from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
 from os import getenv
-import logging
 
-from .database import db, migrate
+from .database import db, migrate, engine_options, init_pool, init_replica, unit_of_work
+from .cache import cache, token_deny_list
+from .counters import request_counter
+from .hashing import password_hasher
+from .jobs import job_runner
+from .compression import compressor
+from .logs import log_pipeline
+from .metrics import metrics
+from .ratelimit import rate_limiter
+from .audit import audit_plans
+from .sweeper import sweep_tokens
 from .utils import read_api_config
 from .config import CONFIGS
-from .utils import read_api_config, api_key_scheme, jwt_scheme, mail
+from .utils import read_api_config, api_key_scheme, jwt_scheme, mail, error_handler
 
 
 API_CONFIG = read_api_config()
@@ -58,6 +67,8 @@ def create_spec_and_doc(app):
     add_component(auth_endpoints.AddUserApi, '/user')
     add_component(auth_endpoints.UserApi, '/user/<int:user_id>')
     add_component(auth_endpoints.UsersApi, '/users')
+    add_component(auth_endpoints.UsersBulkApi, '/users/bulk')
+    add_component(auth_endpoints.UsersBulkJobApi, '/users/bulk/<string:job_id>')
     # add_component(auth_endpoints.ConfirmUserApi, '/confirm-user/<string:confirm_token>')
     add_component(auth_endpoints.TokenApi, '/token')
     add_component(auth_endpoints.RefreshTokenApi, '/refresh-token')
@@ -66,6 +77,8 @@ def create_spec_and_doc(app):
     add_component(main_endpoints.AddRecipeApi, '/recipe')
     add_component(main_endpoints.RecipeApi, '/recipe/<int:recipe_id>')
     add_component(main_endpoints.RecipesApi, '/recipes')
+    add_component(main_endpoints.RecipeSearchApi, '/recipes/search')
+    add_component(main_endpoints.RecipePantryApi, '/recipes/pantry')
 
     return app
 
@@ -75,21 +88,31 @@ def create_app():
 
     flask_app = Flask(__name__)
     flask_app.config.from_object(app_config)
+    log_pipeline.init_app(flask_app)
 
     flask_app = add_security(flask_app)
 
+    flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(flask_app.config)
     db.init_app(flask_app)
+    init_pool(flask_app)
+    init_replica(flask_app)
     migrate.init_app(flask_app, db)
+    cache.init_app(flask_app)
+    token_deny_list.init_app(flask_app, 'JWT_DENY_LIST')
+    request_counter.init_app(flask_app)
+    password_hasher.init_app(flask_app)
+    job_runner.init_app(flask_app)
+    compressor.init_app(flask_app)
+    from .auth.controllers import DeviceController
+    metrics.init_app(flask_app, decorators=[DeviceController.api_required, error_handler])
+    rate_limiter.init_app(flask_app)
+    unit_of_work.init_app(flask_app)
+    flask_app.cli.add_command(audit_plans)
+    flask_app.cli.add_command(sweep_tokens)
 
     # mail.init_app(flask_app)
 
     flask_app = create_spec_and_doc(flask_app)
 
-    logging.basicConfig(
-        filename='record.log',
-        level=logging.DEBUG,
-        format='%(asctime)s %(levelname)s : %(message)s'
-    )
-
     return flask_app
 
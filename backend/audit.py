@@ -0,0 +1,116 @@
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+import click
+import json
+
+from .database import db
+
+
+def lookups() -> list:
+    """Hot find_* lookups with sample arguments, full table reads like find_all are left out"""
+    from .auth.models import User, Admin, Device, Token, RevokedToken
+    from .main.models import Recipe, Ingredient
+    return [
+        (User.find_by_username, ('audit',)),
+        (User.find_by_email, ('audit@example.com',)),
+        (User.find_by_id, (1,)),
+        (User.find_version, (1,)),
+        (Admin.find_by_id, (1,)),
+        (Admin.find_info_by_id, (1,)),
+        (Device.find_by_id, (1,)),
+        (Device.find_by_name, ('audit',)),
+        (Device.find_all_by_name, ('audit',)),
+        (Device.find_by_key, ('0' * 32,)),
+        (Token.find_by_access_token, ('audit',)),
+        (Token.find_identity, ('audit',)),
+        (Token.find_by_refresh_token, ('audit',)),
+        (Token.find_by_user_and_device, (1, 1)),
+        (RevokedToken.find_active, ()),
+        (Recipe.find_by_id, (1,)),
+        (Recipe.find_version, (1,)),
+        (Recipe.find_page, (20,)),
+        (Recipe.find_page, (20,), {'complexity': 'easy'}),
+        (Recipe.find_page, (20,), {'user_id': 1}),
+        (Recipe.search, ('soup', 20)),
+        (Ingredient.find_ids, (['egg', 'flour'],)),
+        (Recipe.find_cookable, ([1, 2, 3], 20)),
+    ]
+
+
+def capture_statements(func, args: tuple, kwargs: dict) -> list:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func(*args, **kwargs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def seq_scans(plan: dict) -> list:
+    scans = [plan['Relation Name']] if plan['Node Type'] == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        scans += seq_scans(child)
+    return scans
+
+
+def table_rows() -> dict:
+    rows = db.session.execute(text("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"))
+    return {name: rows for name, rows in rows}
+
+
+def vacuum_analyze() -> None:
+    """Refreshes statistics and flushes the pending lists of GIN indexes
+
+    A plain ANALYZE leaves rows inserted in bulk in the pending list of the trigram and full text
+    indexes, the planner prices reading it like a scan and falls back to one. VACUUM cannot run
+    inside a transaction, it gets a connection of its own.
+    """
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM ANALYZE')
+
+
+def explain_lookups(min_rows: int) -> list:
+    """(lookup name, large tables scanned sequentially) for every statement the hot lookups run"""
+    sizes = table_rows()
+    connection = db.session.connection()
+    results = []
+    for lookup in lookups():
+        func, args, kwargs = (lookup + ({},))[:3]
+        for statement, parameters in capture_statements(func, args, kwargs):
+            result = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+            plan = (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+            results.append((func.__qualname__, [table for table in seq_scans(plan) if sizes.get(table, 0) >= min_rows]))
+    db.session.rollback()
+    return results
+
+
+@click.command('audit-plans')
+@click.option('--min-rows', default=10000, show_default=True,
+              help='sequential scans of smaller tables are expected and ignored')
+@click.option('--vacuum/--no-vacuum', default=False, show_default=True,
+              help='VACUUM ANALYZE first, needed right after a bulk load')
+@with_appcontext
+def audit_plans(min_rows: int, vacuum: bool):
+    """EXPLAINs every hot lookup, exits with 1 when one scans a large table sequentially
+
+    Plans follow the statistics, audit a database holding production-like data that has been
+    VACUUM ANALYZE-d since it was loaded, e.g. with --vacuum.
+    """
+    if vacuum:
+        vacuum_analyze()
+    failures = 0
+    for name, large in explain_lookups(min_rows):
+        if large:
+            failures += 1
+            click.echo(f"FAIL {name}: seq scan on {', '.join(large)}")
+        else:
+            click.echo(f"ok   {name}")
+    if failures:
+        raise SystemExit(1)
@@ -1,13 +1,38 @@
-from flask import request
+from flask import request, current_app, g
 from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from dataclasses import dataclass
+from functools import wraps, cached_property
 from itsdangerous import URLSafeTimedSerializer
 from os import getenv
+from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
 import json
 
 from . import models
-from backend.utils import UserError, ModerError, AdminError, DeviceError, TokenError
+from . import schemas
+from backend.cache import cache, token_deny_list
+from backend.database import unit_of_work
+from backend.jobs import job_runner
+from backend.counters import request_counter
+from backend.metrics import metrics
+from backend.ratelimit import rate_limiter
+from backend.utils import UserError, ModerError, AdminError, DeviceError, TokenError, get_schema, chunked, dump, \
+    make_etag
+
+
+def commit_deleted(revoked: list, keys: list) -> None:
+    models.Base.commit_deleted(keys)
+    for jti, expires in revoked:
+        token_deny_list.add(jti, expires.timestamp())
+
+
+def revoke_user_tokens(user_id: int) -> None:
+    """Denies the live access tokens of a user, stateless checks trust their claims otherwise"""
+    for jti, expires in models.Token.revoke_where(models.Token.user_id == user_id):
+        token_deny_list.add(jti, expires.timestamp())
 
 
 class UserController:
@@ -63,7 +88,7 @@ class UserController:
 
     #  Creates
 
-    def signup_user(self, user_info: dict) -> dict:
+    def signup_user(self, user_info: dict) -> __model:
         new_user = self.__model(
             first_name=user_info['first_name'],
             last_name=user_info['last_name'],
@@ -73,7 +98,7 @@ class UserController:
             email=user_info['email'],
             password=user_info['password']
         )
-        return new_user.public_info
+        return new_user
 
     def generate_confirm_token(self, email: str) -> str:
         return self.__serializer.dumps(email, salt=self.__salt)
@@ -84,33 +109,102 @@ class UserController:
         except Exception:
             return ''
 
-    def create_users(self, users_data: dict) -> dict:
-        uploaded_users = 0
-        for user in users_data['users']:
+    def __filter_new_users(self, users: list) -> list:
+        taken = self.__model.find_taken(
+            usernames={user['username'] for user in users},
+            emails={user['email'] for user in users}
+        )
+        usernames = {username for username, _ in taken}
+        emails = {email for _, email in taken}
 
-            username_checking = self.check_username_exists(user['username'])
-            if username_checking['status']:
+        new_users = list()
+        for user in users:
+            if user['username'] in usernames or user['email'] in emails:
                 continue
-
-            email_checking = self.check_email_exists(user['email'])
-            if email_checking['status']:
+            usernames.add(user['username'])
+            emails.add(user['email'])
+            new_users.append(user)
+        return new_users
+
+    def create_users(self, users_data, chunk_size: int) -> dict:
+        """Imports an iterable of raw user entries, one duplicates query and one insert per chunk"""
+        schema = get_schema(schemas.NewUserSchema)
+        result = {'uploaded': 0, 'duplicated': 0, 'invalid': 0}
+
+        for chunk in chunked(users_data, chunk_size):
+            users = list()
+            for entry in chunk:
+                try:
+                    users.append(schema.load(entry))
+                except ValidationError:
+                    result['invalid'] += 1
+
+            new_users = self.__filter_new_users(users) if users else []
+            result['duplicated'] += len(users) - len(new_users)
+            if not new_users:
                 continue
 
-            self.create_user(user)
-            uploaded_users += 1
+            hashes = self.__model.create_hashes([user['password'] for user in new_users])
+            uploaded = self.__model.insert_many([
+                {
+                    'first_name': user['first_name'],
+                    'last_name': user['last_name'],
+                    'username': user['username'],
+                    'sex': models.HumanGender(user['sex']),
+                    'birth_date': user['birth_date'],
+                    'email': user['email'],
+                    'hash': password_hash
+                } for user, password_hash in zip(new_users, hashes)
+            ])
+            result['uploaded'] += uploaded
+            result['duplicated'] += len(new_users) - uploaded
+
+        return result
+
+    def start_users_import(self, upload, received: int, user_id: int, chunk_size: int) -> str:
+        """Records an import job and hands the spooled entries to a job thread, returns the job id
+
+        The job owns `upload`, a binary file of JSON lines, and closes it when done.
+        """
+        try:
+            job_id = models.ImportJob.create(user_id, received)
+            job_runner.submit(self.run_users_import, job_id, upload, chunk_size)
+        except Exception:
+            upload.close()
+            raise
+        return job_id
 
-        return {'message': '%s users were uploaded' % uploaded_users}
+    @staticmethod
+    def read_upload(upload):
+        for line in upload:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+    def run_users_import(self, job_id: str, upload, chunk_size: int) -> None:
+        with upload:
+            job = models.ImportJob.find_by_id(job_id)
+            job.set_running()
+            try:
+                result = self.create_users(self.read_upload(upload), chunk_size)
+            except Exception as error:
+                job.fail(str(error))
+                raise
+            job.finish(result)
+        current_app.logger.info("import job: %s uploaded %s users", job_id, result['uploaded'])
 
     #  Changes
 
     @staticmethod
     def confirm_user(user: __model) -> dict:
-        user.change_status('confirmed')
+        user.set_status('confirmed')
         return {'message': f"user: {user.email} has been confirmed"}
 
     def freeze_account(self, email: str) -> dict:
         user = self.__model.find_by_email(email)
-        user.change_status('frozen')
+        user.set_status('frozen')
+        revoke_user_tokens(user.id)
         return {
             'message': f"account: {user.email} has been frozen, check mailbox to access recovering"
         }
@@ -118,12 +212,12 @@ class UserController:
     def recover_account(self, email: str, new_password: str) -> dict:
         user = self.__model.find_by_email(email)
         user.change_password(new_password)
-        user.change_status('confirmed')
+        user.set_status('confirmed')
         return {
             'message': f"account: {user.email} has been recovered with a new password"
         }
 
-    def __change_user_fields(self, user_id: int, username: str, email: str, password: str) -> list:
+    def __change_user_fields(self, user_id: int, username: str, email: str, password: str) -> __model:
         updated_fields = list()
         user = self.__model.find_by_id(user_id)
         if username != '':
@@ -136,9 +230,9 @@ class UserController:
             user.change_password(password)
             updated_fields.append('password')
         user.update()
-        return user.public_info
+        return user
 
-    def change_user_details(self, user_id: int, user_details: dict) -> dict:
+    def change_user_details(self, user_id: int, user_details: dict) -> __model:
         result = self.__change_user_fields(
             user_id=user_id,
             username=user_details['username'],
@@ -151,19 +245,44 @@ class UserController:
 
     @staticmethod
     def delete_user(user: __model) -> dict:
-        user.delete()
-        return {'message': 'user %s was deleted' % user.username}
+        username = user.username
+        UserController.delete_users([user.id])
+        return {'message': 'user %s was deleted' % username}
+
+    @classmethod
+    def delete_users(cls, user_ids: list) -> dict:
+        revoked, keys = cls.__model.delete_many(user_ids)
+        commit_deleted(revoked, keys)
+        return {'message': f"users: {', '.join(map(str, user_ids))} were deleted successfully"}
 
     #  Getting some info
 
+    def get_user_version(self, user_id: int) -> tuple:
+        version = self.__model.find_version(user_id)
+        if not version:
+            return None
+        return make_etag('user', version.id, version.modified), version.modified
+
     def get_user_public_info(self, user_id: int) -> dict:
-        return self.__model.find_by_id(user_id).info
+        key = self.__model.cache_key(user_id)
+        info = cache.get(key)
+        if info is None:
+            user = self.__model.find_by_id(user_id)
+            if not user:
+                return None
+            info = dump(schemas.PublicUserSchema, user)
+            cache.set(key, info)
+        return info
 
     def get_users_public_info(self) -> dict:
-        users_info = list()
-        for user in self.__model.find_all():
-            users_info.append(user.public_info)
-        return {'users': users_info}
+        return {'users': self.__model.find_all()}
+
+    def iter_users_public_info(self, chunk_size: int):
+        return self.__model.iter_all(chunk_size)
+
+    @staticmethod
+    def get_import_job(job_id: str) -> models.ImportJob:
+        return models.ImportJob.find_by_id(job_id)
 
     def get_user_status_by_email(self, email: str) -> enumerate:
         user = self.__model.find_by_email(email)
@@ -200,29 +319,44 @@ class AdminController(UserController):
             return {'status': True, 'output': f"admin: {user_id} exists"}
         return {'status': False, 'output': f"admin: {user_id} does not exist"}
 
-    def create_admin(self, user_id: int, status: enumerate) -> dict:
+    def create_admin(self, user_id: int, status: enumerate) -> __model:
         admin_checking = self.check_admin_exists(user_id)
         if admin_checking['status']:
             admin = self.__model.find_by_id(user_id)
-            admin.change_status(status)
+            admin.set_status(status)
         else:
-            admin = self.__model(user_id, status).upload()
-        return admin.info
+            admin = self.__model(user_id, status)
+        #  the role is a claim of the access token, a new one carries the changed role
+        revoke_user_tokens(user_id)
+        return admin
 
     @staticmethod
     def delete_admin(admin: __model) -> dict:
         admin_id = admin.id
-        admin.delete()
+        AdminController.delete_admins([admin_id])
         return {'message': f"admin: {admin_id} was deleted successfully"}
 
+    @classmethod
+    def delete_admins(cls, admin_ids: list) -> dict:
+        """Admins with their devices and the sessions on them, in one transaction"""
+        revoked, keys = cls.__model.delete_many(admin_ids)
+        commit_deleted(revoked, keys)
+        return {'message': f"admins: {', '.join(map(str, admin_ids))} were deleted successfully"}
+
     def get_admin(self, admin_id: int) -> __model:
         return self.__model.find_by_id(admin_id)
 
+    def get_missing_admins(self, admin_ids: list) -> list:
+        return sorted(set(admin_ids) - set(self.__model.find_existing_ids(admin_ids)))
+
+    def get_admin_info(self, admin_id: int):
+        return self.__model.find_info_by_id(admin_id)
+
     def get_admins_info(self) -> dict:
-        admins_info = list()
-        for admin in self.__model.find_all():
-            admins_info.append(admin.info)
-        return {'admins': admins_info}
+        return {'admins': self.__model.find_all_info()}
+
+    def iter_admins_info(self, chunk_size: int):
+        return self.__model.iter_all_info(chunk_size)
 
     @classmethod
     def moder_required(cls, func):
@@ -251,7 +385,7 @@ class AdminController(UserController):
             if not current_user:
                 UserError('current user is not logged in', 401)
 
-            if not current_user.admin or current_user.role != 'admin':
+            if not current_user.admin or current_user.admin.status.value != 'admin':
                 raise UserError(f'user: {current_user.id} has no permissions', 403)
 
             kwargs['current_admin'] = current_user.admin
@@ -274,26 +408,23 @@ class DeviceController(AdminController):
         return {'status': True, 'output': f'device_name: {name} already exists'}
 
     @classmethod
-    def check_device_key(cls, device) -> dict:
-        if not device or device.status.value == 'disable':
-            return {'status': False, 'output': f'api_key: ...{device.key[-10:]} is not valid'}
-        device.add_request()
-        return {'status': True, 'output': f'api_key: ...{device.key[-10:]} is valid'}
+    def check_device_key(cls, device_key: str, device_status: str) -> dict:
+        if device_status == 'disable':
+            return {'status': False, 'output': f'api_key: ...{device_key[-10:]} is not valid'}
+        return {'status': True, 'output': f'api_key: ...{device_key[-10:]} is valid'}
 
     #  Creates
 
     @classmethod
-    def create_device(cls, user_id: int, name: str) -> dict:
-        device = cls.__model(user_id, name)
-        return device.info
+    def create_device(cls, user_id: int, name: str) -> __model:
+        return cls.__model(user_id, name)
 
     @classmethod
-    def add_device_request(cls, device_key: str):
-        device = cls.__model.find_by_key(device_key)
-        device.add_request()
+    def add_device_request(cls, device_id: int):
+        request_counter.add(device_id)
 
     @staticmethod
-    def change_device_fields(device: __model, device_data: dict) -> dict:
+    def change_device_fields(device: __model, device_data: dict) -> __model:
         updated_fields = list()
         if device_data['name'] != '':
             device.name = device_data['name']
@@ -304,26 +435,18 @@ class DeviceController(AdminController):
         if device_data['refresh_key'] is True:
             device.refresh_key()
             updated_fields.append('key')
-        return device.info
+        return device
 
     #  Deletes
 
-    @staticmethod
-    def __delete_device_tokens(tokens: list) -> None:
-        for token in tokens:
-            token.delete()
-        return
-
     def delete_device(self, device: __model) -> dict:
         device_id = device.id
-        if device.tokens:
-            self.__delete_device_tokens(device.tokens)
-        device.delete()
+        self.delete_devices([device_id])
         return {'message': f"device: {device_id} was deleted successfully"}
 
-    def delete_devices(self, devices: list) -> None:
-        for device in devices:
-            self.delete_device(device)
+    def delete_devices(self, device_ids: list) -> None:
+        revoked, keys = self.__model.delete_where(self.__model.id.in_(device_ids))
+        commit_deleted(revoked, keys)
         return
 
     #  Gets
@@ -334,38 +457,69 @@ class DeviceController(AdminController):
 
     @classmethod
     def get_devices_by_name(cls, name: str) -> dict:
-        devices_info = list()
-        for device in cls.__model.find_all_by_name(name):
-            devices_info.append(device.info)
-        return {'devices': devices_info}
+        return {'devices': cls.__model.find_all_by_name(name)}
 
     @classmethod
     def get_device_by_key(cls, device_key: str) -> __model:
         return cls.__model.find_by_key(device_key)
 
+    @classmethod
+    def get_device_identity(cls, device_key: str) -> tuple:
+        key = cls.__model.key_cache_key(device_key)
+        identity = cache.get(key)
+        if identity is None:
+            device = cls.get_device_by_key(device_key)
+            if not device:
+                return None
+            identity = (device.id, device.status.value)
+            cache.set(key, identity, ttl=current_app.config['API_KEY_CACHE_TTL'])
+        return identity
+
+    @classmethod
+    def authenticate(cls, api_key: str) -> int:
+        if not api_key:
+            raise DeviceError('there is no api-key', 400)
+
+        identity = cls.get_device_identity(api_key)
+        if not identity:
+            raise DeviceError('api-key is not valid', 401)
+
+        device_id, device_status = identity
+        key_checking = cls.check_device_key(api_key, device_status)
+        if not key_checking['status']:
+            raise DeviceError(key_checking['output'], 403)
+
+        rate_limiter.check_device(device_id, device_status)
+        cls.add_device_request(device_id)
+        return device_id
+
     @classmethod
     def api_required(cls, func):
         @wraps(func)
         def decorator(*args, **kwargs):
-            headers = request.headers
+            with metrics.stage('api_required'):
+                kwargs['current_device_id'] = cls.authenticate(request.headers.get('X-Api-Key'))
 
-            api_key = headers.get('X-Api-Key')
-            if not api_key:
-                raise DeviceError('there is no api-key', 400)
+            return func(*args, **kwargs)
 
-            device = cls.get_device_by_key(api_key)
-            if not device:
-                raise DeviceError('api-key is not valid', 401)
+        return decorator
 
-            key_checking = cls.check_device_key(device)
-            if not key_checking['status']:
-                raise DeviceError(key_checking['output'], 403)
 
-            kwargs['current_device_id'] = device.id
+@dataclass
+class UserIdentity:
+    """Current user restored from access-token claims, touches the db only for admin rights"""
+    id: int
+    username: str
+    role: str
 
-            return func(*args, **kwargs)
+    def __repr__(self):
+        return f"user: {self.username}"
 
-        return decorator
+    @cached_property
+    def admin(self) -> models.Admin:
+        if self.role == 'user':
+            return None
+        return models.Admin.find_by_id(self.id)
 
 
 class TokenController(UserController):
@@ -424,15 +578,40 @@ class TokenController(UserController):
             time_ago = cls.now() - token.expires
             return {
                 'status': False,
-                'output': f'access_token: ...{token.access_token[-10:]} expired {time_ago.timestamp()//60} minutes ago'
+                'output': f'access_token of {token} expired {time_ago.timestamp()//60} minutes ago'
             }
 
         validity_checking = cls.check_validity(token.expires)
         if not validity_checking['status']:
             token.set_expired()
-            return {'status': False, 'output': f'access_token: ...{token.access_token[-10:]} is expired'}
+            return {'status': False, 'output': f'access_token of {token} is expired'}
+
+        return {'status': True, 'output': f'access_token of {token} is valid'}
+
+    @classmethod
+    def check_access_claims(cls, access_token: str, device_id: int) -> dict:
+        try:
+            claims = decode_token(access_token)
+        except ExpiredSignatureError:
+            return {'status': False, 'output': f'access_token: ...{access_token[-10:]} is expired', 'code': 401}
+        except (PyJWTError, JWTExtendedException):
+            return {'status': False, 'output': 'Auth-Key is not valid', 'code': 401}
+
+        if claims.get('type') != 'access':
+            return {'status': False, 'output': 'Auth-Key is not an access token', 'code': 401}
+
+        if token_deny_list.contains(claims['jti'], cls.get_revoked_tokens):
+            return {'status': False, 'output': f'access_token: ...{access_token[-10:]} is revoked', 'code': 401}
+
+        entity = json.loads(claims['sub'].replace("'", "\""))
+        if claims.get('device_id') != device_id:
+            return {'status': False, 'output': f"user: {entity['id']} logged in from another device", 'code': 403}
+
+        if claims.get('status') != 'confirmed':
+            return {'status': False, 'output': f"user: {entity['username']} is not confirmed", 'code': 409}
 
-        return {'status': True, 'output': f'access_token: ...{token.access_token[-10:]} is valid'}
+        identity = UserIdentity(id=entity['id'], username=entity['username'], role=claims.get('role', 'user'))
+        return {'status': True, 'output': f'access_token: ...{access_token[-10:]} is valid', 'identity': identity}
 
     @classmethod
     def check_refresh_token(cls, user_id: int, refresh_token: str) -> dict:
@@ -458,21 +637,31 @@ class TokenController(UserController):
 
     #  Creates
 
+    @staticmethod
+    def access_claims(user, device_id: int) -> dict:
+        return {'device_id': device_id, 'role': user.role, 'status': user.status.value}
+
     @classmethod
     def create_token(cls, user, device_id: int) -> dict:
         time_now = datetime.now(cls.tz)
         expires_date = time_now + cls.access_delta
+        refresh_expires = time_now + cls.refresh_delta
 
-        refresh_entity = {'id': user.id, 'expires_at': (time_now + cls.refresh_delta).isoformat()}
-        access_token = create_access_token(identity=str(user.entity), expires_delta=cls.access_delta)
+        refresh_entity = {'id': user.id, 'expires_at': refresh_expires.isoformat()}
+        access_token = create_access_token(identity=str(user.entity), expires_delta=cls.access_delta,
+                                           additional_claims=cls.access_claims(user, device_id))
         refresh_token = create_refresh_token(identity=str(refresh_entity), expires_delta=cls.refresh_delta)
+        access_jti = decode_token(access_token)['jti']
 
         old_token = cls.get_token_by_user_and_device(user.id, device_id)
         if old_token:
+            cls.revoke_token(old_token)
             old_token.update_data(
                 access_token=access_token,
+                access_jti=access_jti,
                 refresh_token=refresh_token,
-                expires=expires_date
+                expires=expires_date,
+                refresh_expires=refresh_expires
             )
             return {'access_token': access_token}, refresh_token
 
@@ -480,52 +669,112 @@ class TokenController(UserController):
             device_id=device_id,
             user_id=user.id,
             access_token=access_token,
+            access_jti=access_jti,
             refresh_token=refresh_token,
-            expires=expires_date
-        ).upload()
+            expires=expires_date,
+            refresh_expires=refresh_expires
+        )
 
         return {'access_token': access_token}, refresh_token
 
     @classmethod
     def refresh_access(cls, refresh_token: str) -> dict:
         token = cls.__model.find_by_refresh_token(refresh_token)
-        access_token = create_access_token(identity=str(token.user_entity), expires_delta=cls.access_delta)
-        token.update_access(access_token, datetime.now() + cls.access_delta)
+        cls.revoke_token(token)
+        access_token = create_access_token(identity=str(token.user_entity), expires_delta=cls.access_delta,
+                                           additional_claims=cls.access_claims(token.user, token.device_id))
+        token.update_access(access_token, decode_token(access_token)['jti'], datetime.now() + cls.access_delta)
         return {'access_token': access_token}
 
+    #  Deletes
+
+    @classmethod
+    def revoke_token(cls, token: __model) -> None:
+        """Denies the access token of a stored session until it would have expired anyway"""
+        if not token.access_jti or not token.expires:
+            return
+        expires = token.expires if token.expires.tzinfo else token.expires.replace(tzinfo=cls.tz)
+        if expires <= cls.now():
+            return
+        try:
+            with unit_of_work.savepoint():
+                models.RevokedToken(token.access_jti, expires)
+        except IntegrityError:
+            #  revoked already, the rest of the request still commits
+            pass
+        token_deny_list.add(token.access_jti, expires.timestamp())
+
+    @classmethod
+    def delete_token(cls, user_id: int, device_id: int) -> dict:
+        token = cls.get_token_by_user_and_device(user_id, device_id)
+        if not token:
+            return {'message': f"user: {user_id} has no session on device: {device_id}"}
+        cls.revoke_token(token)
+        token.delete()
+        return {'message': f"user: {user_id} logged out from device: {device_id}"}
+
     #  Gets
 
+    @classmethod
+    def load_identity(cls, access_token: str) -> __model:
+        """Token, user, admin and device of the request, queried once and kept on flask.g"""
+        if getattr(g, 'identity_key', None) != access_token:
+            g.identity_key = access_token
+            g.identity = cls.__model.find_identity(access_token)
+        return g.identity
+
+    @staticmethod
+    def get_revoked_tokens() -> list:
+        return [(token.jti, token.expires.timestamp()) for token in models.RevokedToken.find_active()]
+
     @classmethod
     def get_token_by_user_and_device(cls, user_id: int, device_id: int):
         return cls.__model.find_by_user_and_device(user_id, device_id)
 
     @classmethod
-    def user_required(cls, func):
-        @wraps(func)
-        def decorator(*args, **kwargs):
-            access_token = request.headers.get('X-Auth-Key', None)
-            if not access_token:
-                raise UserError('there is no Auth-Key', 400)
+    def authenticate(cls, access_token: str, device_id: int):
+        if not access_token:
+            raise UserError('there is no Auth-Key', 400)
+
+        if current_app.config['JWT_STATELESS']:
+            claims_checking = cls.check_access_claims(access_token, device_id)
+            if not claims_checking['status']:
+                raise UserError(claims_checking['output'], claims_checking['code'])
 
-            token = cls.__model.find_by_access_token(access_token)
-            if not token:
-                raise UserError('Auth-Key is not valid', 401)
+            rate_limiter.check_user(claims_checking['identity'].id)
+            return claims_checking['identity']
 
-            if token.device_id != kwargs['current_device_id']:
-                raise UserError(f"user: {token.user_id} logged in from another device", 403)
+        token = cls.load_identity(access_token)
+        if not token:
+            raise UserError('Auth-Key is not valid', 401)
 
-            token_checking = cls.check_access_token(token)
-            if not token_checking['status']:
-                raise UserError(token_checking['output'], 401)
+        if token.device_id != device_id:
+            raise UserError(f"user: {token.user_id} logged in from another device", 403)
 
-            user = token.user
-            if not user:
-                raise UserError(f"user: {token.user_id} not found", 404)
+        if token.device.status.value == 'disable':
+            raise UserError(f"device: {token.device_id} is disabled", 403)
+
+        token_checking = cls.check_access_token(token)
+        if not token_checking['status']:
+            raise UserError(token_checking['output'], 401)
+
+        user = token.user
+        if not user:
+            raise UserError(f"user: {token.user_id} not found", 404)
 
-            if user.status.value != 'confirmed':
-                raise UserError(f"{user} is not confirmed", 409)
+        if user.status.value != 'confirmed':
+            raise UserError(f"{user} is not confirmed", 409)
 
-            kwargs['current_user'] = user
+        rate_limiter.check_user(user.id)
+        return user
+
+    @classmethod
+    def user_required(cls, func):
+        @wraps(func)
+        def decorator(*args, **kwargs):
+            with metrics.stage('user_required'):
+                access_token = request.headers.get('X-Auth-Key', None)
+                kwargs['current_user'] = cls.authenticate(access_token, kwargs['current_device_id'])
 
             return func(*args, **kwargs)
 
@@ -1,10 +1,14 @@
 from flask import current_app, after_this_request, request
 from flask_apispec import marshal_with, doc, use_kwargs
 from flask_apispec.views import MethodResource
+from tempfile import TemporaryFile
 from . import controllers
 from . import schemas
+from backend.compression import compressor
 from backend.utils import (UserError, TokenError, DeviceError, AdminError, MailError, MailController,
-                           error_handler, ep_responses, device_header, user_header)
+                           error_handler, ep_responses, device_header, user_header,
+                           streaming_requested, stream_json, dump, NDJSON_MIMETYPE, not_modified, validators)
+import json
 
 api_required = controllers.DeviceController.api_required
 user_required = controllers.TokenController.user_required
@@ -38,7 +42,7 @@ class AddDeviceApi(MethodResource):
                                  (404, "user not found"),
                                  (409, "device-name exists")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def post(self, **device_data) -> tuple:
 
         current_user = device_data['current_user']
@@ -55,9 +59,9 @@ class AddDeviceApi(MethodResource):
             raise DeviceError(device_checking['output'], 409)
 
         result = self.__controller.create_device(device_data['admin_id'], device_data['name'])
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"{current_user} created device: {result['id']}:{result['name']}")
+        current_app.logger.info("%s created device: %s:%s", current_user, result.id, result.name)
 
         return response, 201
 
@@ -69,7 +73,7 @@ class AddDeviceApi(MethodResource):
                                  (404, "device does not exist"),
                                  (409, "device is already enable/disable")]))
     @use_kwargs(__schemas['contribution'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def put(self, **device_data):
 
         current_user = device_data['current_user']
@@ -85,9 +89,9 @@ class AddDeviceApi(MethodResource):
             raise DeviceError(f"device: {device.id} is already {device_data['status']}", 409)
 
         result = self.__controller.change_device_fields(device, device_data)
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"{current_user} updated {device}")
+        current_app.logger.info("%s updated %s", current_user, device)
 
         return response, 201
 
@@ -111,7 +115,7 @@ class DeviceApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(403, "current admin has no permission"),
                                  (404, "device not found")]))
-    @marshal_with(__schemas['response'], code=200)
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, device_id, **kwargs):
 
         current_user = kwargs['current_user']
@@ -123,8 +127,8 @@ class DeviceApi(MethodResource):
         if device.admin_id != current_user.id and current_user.role != 'admin':
             raise DeviceError(f"admin: {current_user.id} has no permission for device: {device_id}", 403)
 
-        response = self.__schemas['response']().load(device.info)
-        current_app.logger.info(f"sent to {current_user} {device} info")
+        response = dump(self.__schemas['response'], device)
+        current_app.logger.info("sent to %s %s info", current_user, device)
         return response, 200
 
     @doc(tags=[ADMIN],
@@ -134,7 +138,7 @@ class DeviceApi(MethodResource):
          responses=ep_responses([(403, "current admin has now permission"),
                                  (404, "device not found"),
                                  (409, "device is not enable")]))
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def patch(self, device_id, **kwargs):
 
         current_user = kwargs['current_user']
@@ -150,9 +154,9 @@ class DeviceApi(MethodResource):
             raise DeviceError(f"device: {device_id} is not enable", 409)
 
         device.refresh_key()
-        response = self.__schemas['response']().load(device.info)
+        response = dump(self.__schemas['response'], device)
 
-        current_app.logger.info(f"{current_user} refreshed key of {device}")
+        current_app.logger.info("%s refreshed key of %s", current_user, device)
 
         return response, 201
 
@@ -162,7 +166,7 @@ class DeviceApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(403, "current admin has no permissions"),
                                  (404, "device not found")]))
-    @marshal_with(__schemas['output'], code=204)
+    @marshal_with(__schemas['output'], code=204, apply=False)
     def delete(self, device_id, **kwargs):
 
         current_user = kwargs['current_user']
@@ -175,11 +179,10 @@ class DeviceApi(MethodResource):
             raise DeviceError(f"user: {current_user.id} has no permission for device: {device.id}", 403)
 
         result = self.__controller.delete_device(device)
-        output = self.__schemas['output']().load(result)
 
-        current_app.logger.info(f"{current_user} deleted {device} successfully")
+        current_app.logger.info("%s deleted device: %s successfully", current_user, device_id)
 
-        return output, 204
+        return result, 204
 
 
 class AddAdminApi(MethodResource):
@@ -203,7 +206,7 @@ class AddAdminApi(MethodResource):
          responses=ep_responses([(403, "current user has no permissions"),
                                  (404, "sent user or user-status not found")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def post(self, **user_data):
 
         current_user = user_data['current_user']
@@ -216,9 +219,10 @@ class AddAdminApi(MethodResource):
             raise UserError(user_checking['output'], 404)
 
         result = self.__controller.create_admin(user_data['user_id'], user_data['status'])
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"{current_user} upgraded user: {user_data['user_id']} to {user_data['status']}")
+        current_app.logger.info("%s upgraded user: %s to %s",
+                                current_user, user_data['user_id'], user_data['status'])
 
         return response, 201
 
@@ -242,20 +246,20 @@ class AdminApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(403, "current admin has no permissions"),
                                  (404, "admin not found")]))
-    @marshal_with(__schemas['response'], code=200)
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, admin_id, **kwargs):
 
         current_user = kwargs['current_user']
 
-        admin = self.__controller.get_admin(admin_id)
+        admin = self.__controller.get_admin_info(admin_id)
         if not admin:
             raise AdminError(f"admin: {current_user.id} not found", 404)
 
         if admin.id != current_user.id and current_user.role != 'admin':
             raise AdminError(f"admin: {current_user.id} has no permission for admin: {admin.id}", 403)
 
-        response = self.__schemas['response']().load(admin.info)
-        current_app.logger.info(f"sent to {current_user} info of {admin}")
+        response = dump(self.__schemas['response'], admin)
+        current_app.logger.info("sent to %s info of admin: %s", current_user, admin.id)
 
         return response, 200
 
@@ -265,7 +269,7 @@ class AdminApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(403, "current admin has no permissions"),
                                  (404, "admin not found")]))
-    @marshal_with(__schemas['output'], code=204)
+    @marshal_with(__schemas['output'], code=204, apply=False)
     def delete(self, admin_id, **kwargs):
 
         current_user = kwargs['current_user']
@@ -277,21 +281,19 @@ class AdminApi(MethodResource):
         if admin.id != current_user.id and current_user.role != 'admin':
             raise AdminError(f"admin: {current_user.id} has no permission for admin: {admin.id}", 403)
 
-        if admin.devices:
-            self.__controller.delete_devices(admin.devices)
-
         result = self.__controller.delete_admin(admin)
-        output = self.__schemas['output']().load(result)
 
-        current_app.logger.info(f"{current_user} deleted {admin}")
+        current_app.logger.info("%s deleted admin: %s", current_user, admin_id)
 
-        return output, 204
+        return result, 204
 
 
 class AdminsApi(MethodResource):
     __controller = controllers.AdminController()
     __schemas = {
-        'response': schemas.AdminsSchema
+        'request': schemas.AdminIdsSchema,
+        'response': schemas.AdminsSchema,
+        'output': schemas.OutputSchema
     }
     decorators = [
         admin_required,
@@ -302,10 +304,10 @@ class AdminsApi(MethodResource):
 
     @doc(tags=[ADMIN],
          summary='returns list of Admin entities',
-         description='receives admin name',
+         description='receives admin name; streams admins with stream=true or Accept: application/x-ndjson',
          security=[device_header, user_header],
          responses=ep_responses([(403, "current user has no permission")]))
-    @marshal_with(__schemas['response'], code=200)
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, **kwargs):
 
         current_user = kwargs['current_user']
@@ -313,13 +315,44 @@ class AdminsApi(MethodResource):
         if current_user.role != 'admin':
             raise AdminError(f"admin: {current_user.id} has no permission for admins", 403)
 
+        if streaming_requested():
+            current_app.logger.info("streams to %s all admins info", current_user)
+            admins = self.__controller.iter_admins_info(current_app.config['STREAM_CHUNK_SIZE'])
+            return stream_json('admins', admins, schemas.AdminSchema)
+
         result = self.__controller.get_admins_info()
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"sent to {current_user} all admins info")
+        current_app.logger.info("sent to %s all admins info", current_user)
 
         return response, 200
 
+    @doc(tags=[ADMIN],
+         summary='deletes Admin entities in bulk with chained devices and sessions',
+         description='Receives list of admin ids, deletes them in one transaction',
+         security=[device_header, user_header],
+         responses=ep_responses([(403, "current user has no permission"),
+                                 (404, "some admins not found")]))
+    @use_kwargs(__schemas['request'], location='json')
+    @marshal_with(__schemas['output'], code=204, apply=False)
+    def delete(self, **kwargs):
+
+        current_user = kwargs['current_user']
+        admin_ids = sorted(set(kwargs['admin_ids']))
+
+        if current_user.role != 'admin':
+            raise AdminError(f"admin: {current_user.id} has no permission for admins", 403)
+
+        missing = self.__controller.get_missing_admins(admin_ids)
+        if missing:
+            raise AdminError(f"admins: {', '.join(map(str, missing))} not found", 404)
+
+        result = self.__controller.delete_admins(admin_ids)
+
+        current_app.logger.info("%s deleted admins: %s", current_user, admin_ids)
+
+        return result, 204
+
 
 AUTH = 'Auth operations'
 
@@ -342,7 +375,7 @@ class AddUserApi(MethodResource):
          security=[device_header],
          responses=ep_responses([(409, "username or email exists")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def post(self, **user_data):
 
         username_checking = self.__controller.check_username_exists(user_data['username'])
@@ -356,9 +389,9 @@ class AddUserApi(MethodResource):
         result = self.__controller.signup_user(user_data)
         # confirm_token = self.__controller.generate_confirm_token(result['email'])
         # self.__mail_controller.send_confirmation(result['email'], result['fullname'], confirm_token)
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"user: {result['id']} signed up")
+        current_app.logger.info("user: %s signed up", result.id)
 
         return response, 201
 
@@ -380,7 +413,7 @@ class ConfirmUserApi(MethodResource):
          security=[device_header],
          responses=ep_responses([(404, "token or email is not valid"),
                                  (409, "user status is not unconfirmed")]))
-    @marshal_with(__schemas['output'], code=204)
+    @marshal_with(__schemas['output'], code=204, apply=False)
     def patch(self, confirm_token, **user_data):
 
         email = self.__controller.check_token(confirm_token)
@@ -395,11 +428,10 @@ class ConfirmUserApi(MethodResource):
             raise UserError(f'user: {user.id} is not unconfirmed', 409)
 
         result = self.__controller.confirm_user(user)
-        output = self.__schemas['output']().load(result)
 
-        current_app.logger.info(f"user: {user.id} has confirmed itself")
+        current_app.logger.info("user: %s has confirmed itself", user.id)
 
-        return output, 204
+        return result, 204
 
 
 class TokenApi(MethodResource):
@@ -421,7 +453,7 @@ class TokenApi(MethodResource):
                                  (403, "current user is not confirmed"),
                                  (404, "username not found")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=202)
+    @marshal_with(__schemas['response'], code=202, apply=False)
     def post(self, **user_data):
 
         user = self.__controller.get_user_by_username(user_data['username'])
@@ -434,8 +466,11 @@ class TokenApi(MethodResource):
         if user.status.value != 'confirmed':
             raise TokenError(f"user: {user.username} is not confirmed", 403)
 
+        if user.rehash_password(user_data['password']):
+            current_app.logger.info("%s password rehashed with current cost factor", user)
+
         result, cookie = self.__controller.create_token(user, user_data['current_device_id'])
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
         @after_this_request
         def set_refresh_cookie(resp):
@@ -447,7 +482,7 @@ class TokenApi(MethodResource):
             )
             return resp
 
-        current_app.logger.info(f"{user} logged in ")
+        current_app.logger.info("%s logged in", user)
 
         return response, 202
 
@@ -455,7 +490,8 @@ class TokenApi(MethodResource):
 class RefreshTokenApi(MethodResource):
     __controller = controllers.TokenController()
     __schemas = {
-        'response': schemas.TokenSchema
+        'response': schemas.TokenSchema,
+        'output': schemas.OutputSchema
     }
     decorators = [
         user_required,
@@ -469,7 +505,7 @@ class RefreshTokenApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(400, "have not refresh-token in sent cookie"),
                                  (401, "refresh-token is not valid")]))
-    @marshal_with(__schemas['response'], code=202)
+    @marshal_with(__schemas['response'], code=202, apply=False)
     def patch(self, **user_data):
 
         current_user = user_data['current_user']
@@ -483,12 +519,32 @@ class RefreshTokenApi(MethodResource):
             raise TokenError(token_checking['output'], 401)
 
         result = self.__controller.refresh_access(refresh_token)
-        response = self.__schemas['response']().load(result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"{current_user} refreshed access")
+        current_app.logger.info("%s refreshed access", current_user)
 
         return response, 202
 
+    @doc(tags=[AUTH],
+         summary='logs out: revokes auth token and deletes refresh token',
+         description='Receives current session',
+         security=[device_header, user_header])
+    @marshal_with(__schemas['output'], code=204, apply=False)
+    def delete(self, **user_data):
+
+        current_user = user_data['current_user']
+
+        result = self.__controller.delete_token(current_user.id, user_data['current_device_id'])
+
+        @after_this_request
+        def delete_refresh_cookie(resp):
+            resp.delete_cookie(key='refresh_token')
+            return resp
+
+        current_app.logger.info("%s logged out", current_user)
+
+        return result, 204
+
 
 class UserApi(MethodResource):
     __controller = controllers.UserController()
@@ -505,24 +561,30 @@ class UserApi(MethodResource):
 
     @doc(tags=[AUTH],
          summary='returns User entity by id',
-         description='Sends User public info dictionary',
+         description='Sends User public info dictionary, honours If-None-Match and If-Modified-Since',
          security=[device_header, user_header],
-         responses=ep_responses([(404, "user does not exist")]))
-    @marshal_with(__schemas['response'], code=200)
+         responses=ep_responses([(304, "user not modified"),
+                                 (404, "user does not exist")]))
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, user_id, **kwargs):
 
         current_user = kwargs['current_user']
 
-        user = self.__controller.get_user(user_id)
-
-        if not user:
+        version = self.__controller.get_user_version(user_id)
+        if not version:
             raise UserError(f"user: {user_id} not found", 404)
 
-        response = self.__schemas['response']().load(user.public_info)
+        cached = not_modified(*version) or compressor.lookup(version[0], validators(*version))
+        if cached:
+            return cached
 
-        current_app.logger.info(f"sends to {current_user} public info of {user}")
+        response = self.__controller.get_user_public_info(user_id)
+        if not response:
+            raise UserError(f"user: {user_id} not found", 404)
 
-        return response, 200
+        current_app.logger.info("sends to %s public info of user: %s", current_user, user_id)
+
+        return response, 200, validators(*version)
 
     @doc(tags=[AUTH],
          summary='updates User details',
@@ -532,7 +594,7 @@ class UserApi(MethodResource):
                                  (404, "user_id does not exist"),
                                  (409, "passwords do not match")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def put(self, user_id, **user_data):
 
         current_user = user_data['current_user']
@@ -548,9 +610,9 @@ class UserApi(MethodResource):
             raise UserError(repeat_checking['output'], 409)
 
         result = self.__controller.change_user_details(user_id, user_data)
-        response = self.__schemas['response']().load(data=result)
+        response = dump(self.__schemas['response'], result)
 
-        current_app.logger.info(f"{current_user} updated details of user: {user_id}")
+        current_app.logger.info("%s updated details of user: %s", current_user, user_id)
 
         return response, 201
 
@@ -560,7 +622,7 @@ class UserApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(403, "current user has no permissions"),
                                  (404, "user_id does not exist")]))
-    @marshal_with(__schemas['output'], code=204)
+    @marshal_with(__schemas['output'], code=204, apply=False)
     def delete(self, user_id, **kwargs):
 
         current_user = kwargs['current_user']
@@ -573,11 +635,10 @@ class UserApi(MethodResource):
             raise UserError(f"user: {current_user.id} has no permission for user: {user_id}", 403)
 
         result = self.__controller.delete_user(user)
-        output = self.__schemas['output']().load(result)
 
-        current_app.logger.info(f"{current_user} deleted user: {user_id}")
+        current_app.logger.info("%s deleted user: %s", current_user, user_id)
 
-        return output, 204
+        return result, 204
 
 
 class UsersApi(MethodResource):
@@ -594,15 +655,111 @@ class UsersApi(MethodResource):
 
     @doc(tags=[AUTH],
          summary='returns User entities',
-         description='Sends list of User public info',
+         description='Sends list of User public info; streams it with stream=true or Accept: application/x-ndjson',
          security=[device_header, user_header])
-    @marshal_with(__schemas['response'], code=200)
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, **kwargs):
         current_user = kwargs['current_user']
 
+        if streaming_requested():
+            current_app.logger.info("streams to %s all users public info", current_user)
+            users = self.__controller.iter_users_public_info(current_app.config['STREAM_CHUNK_SIZE'])
+            return stream_json('users', users, schemas.PublicUserSchema)
+
         users = self.__controller.get_users_public_info()
-        response = self.__schemas['response']().load(users)
+        response = dump(self.__schemas['response'], users)
+
+        current_app.logger.info("sends to %s all users public info", current_user)
+
+        return response, 200
+
+
+class UsersBulkApi(MethodResource):
+    __controller = controllers.UserController()
+    __schemas = {
+        'response': schemas.ImportJobSchema
+    }
+    decorators = [
+        admin_required,
+        user_required,
+        api_required,
+        error_handler
+    ]
+
+    @staticmethod
+    def spool_users() -> tuple:
+        """Copies the entries to a temp file, one JSON line each, returns it rewound with the entry count
+
+        NDJSON bodies pass through line by line and never sit in memory whole.
+        """
+        upload = TemporaryFile()
+        received = 0
+        try:
+            if request.mimetype != NDJSON_MIMETYPE:
+                body = request.get_json(silent=True)
+                if not isinstance(body, dict) or not isinstance(body.get('users'), list):
+                    raise UserError('body must be a JSON object with a "users" list', 422)
+                lines = (json.dumps(user).encode() + b'\n' for user in body['users'])
+            else:
+                lines = (line.rstrip(b'\r\n') + b'\n' for line in request.stream if line.strip())
+            for line in lines:
+                upload.write(line)
+                received += 1
+        except Exception:
+            upload.close()
+            raise
+        upload.seek(0)
+        return upload, received
+
+    @doc(tags=[AUTH],
+         summary='starts a bulk import of User entities',
+         description='Receives {"users": [...]} JSON or NDJSON body with one new user per line, '
+                     'imports it in the background skipping invalid entries and taken usernames or e-mails, '
+                     'poll /users/bulk/<job_id> for the result',
+         security=[device_header, user_header],
+         responses=ep_responses([(403, "current user has no permission")]))
+    @marshal_with(__schemas['response'], code=202, apply=False)
+    def post(self, **kwargs):
+        current_user = kwargs['current_user']
+
+        #  the body is spooled here, the request context is gone once the job runs
+        upload, received = self.spool_users()
+        job_id = self.__controller.start_users_import(upload, received, current_user.id,
+                                                      current_app.config['BULK_IMPORT_CHUNK_SIZE'])
+        response = dump(self.__schemas['response'], self.__controller.get_import_job(job_id))
+
+        current_app.logger.info("%s started import job: %s of %s users", current_user, job_id, received)
+
+        return response, 202
+
+
+class UsersBulkJobApi(MethodResource):
+    __controller = controllers.UserController()
+    __schemas = {
+        'response': schemas.ImportJobSchema
+    }
+    decorators = [
+        admin_required,
+        user_required,
+        api_required,
+        error_handler
+    ]
+
+    @doc(tags=[AUTH],
+         summary='returns a bulk import job',
+         description='Sends the status and counters of a User import job',
+         security=[device_header, user_header],
+         responses=ep_responses([(403, "current user has no permission"),
+                                 (404, "import job does not exist")]))
+    @marshal_with(__schemas['response'], code=200, apply=False)
+    def get(self, job_id, **kwargs):
+        current_user = kwargs['current_user']
+
+        job = self.__controller.get_import_job(job_id)
+        if not job:
+            raise UserError(f"import job: {job_id} not found", 404)
+        response = dump(self.__schemas['response'], job)
 
-        current_app.logger.info(f"sends to {current_user} all users public info")
+        current_app.logger.info("sends to %s import job: %s", current_user, job_id)
 
         return response, 200
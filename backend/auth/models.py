@@ -1,12 +1,17 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Enum, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, ForeignKey, Index, LargeBinary, update, \
+    delete, select, bindparam, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import inspect
+from sqlalchemy.orm import relationship, joinedload
 from sqlalchemy.sql import func
-from flask_bcrypt import generate_password_hash, check_password_hash
 from uuid import uuid4
+import hashlib
 import enum
 import datetime
 
 from backend.database import db, Base
+from backend.hashing import password_hasher
+from backend.main.models import Recipe, Ingredient
 
 
 class HumanGender(enum.Enum):
@@ -103,12 +108,65 @@ class User(db.Model, Base):
     def find_all(cls):
         return cls.query.all()
 
+    @classmethod
+    def iter_all(cls, chunk_size: int):
+        return cls.query.order_by(cls.id).yield_per(chunk_size)
+
+    @classmethod
+    def find_version(cls, _id: int):
+        modified = func.coalesce(cls.time_updated, cls.time_created).label('modified')
+        return db.session.query(cls.id, modified).filter(cls.id == _id).first()
+
+    @classmethod
+    def delete_many(cls, ids: list) -> tuple:
+        """Deletes users with their admin rights, devices, sessions and recipes, uncommitted
+
+        Returns the (jti, expires) pairs of revoked access tokens and the cache keys of removed rows.
+        """
+        revoked, keys = Admin.delete_many(ids)
+        revoked += Token.delete_where(Token.user_id.in_(ids))
+        Ingredient.uncount_recipes(select(Recipe.id).where(Recipe.user_id.in_(ids)))
+        recipes = db.session.execute(
+            delete(Recipe.__table__).where(Recipe.user_id.in_(ids)).returning(Recipe.id)
+        )
+        keys += [Recipe.cache_key(recipe_id) for recipe_id, in recipes]
+        users = db.session.execute(delete(cls.__table__).where(cls.id.in_(ids)).returning(cls.id))
+        keys += [cls.cache_key(user_id) for user_id, in users]
+        return revoked, keys
+
+    @classmethod
+    def find_taken(cls, usernames: set, emails: set) -> list:
+        return db.session.query(cls.username, cls.email) \
+            .filter(or_(cls.username.in_(usernames), cls.email.in_(emails))) \
+            .all()
+
+    @classmethod
+    def insert_many(cls, users: list) -> int:
+        statement = insert(cls.__table__).values(users).on_conflict_do_nothing()
+        result = db.session.execute(statement)
+        db.session.commit()
+        return result.rowcount
+
     @staticmethod
     def create_hash(password: str) -> str:
-        return generate_password_hash(password).decode('UTF-8')
+        return password_hasher.hash(password)
+
+    @staticmethod
+    def create_hashes(passwords: list) -> list:
+        return password_hasher.hash_many(passwords)
 
     def verify_password(self, password: str) -> bool:
-        return check_password_hash(self.hash, password)
+        return password_hasher.verify(self.hash, password)
+
+    def change_password(self, password: str) -> None:
+        self.hash = self.create_hash(password)
+
+    def rehash_password(self, password: str) -> bool:
+        if not password_hasher.needs_rehash(self.hash):
+            return False
+        self.change_password(password)
+        self.update()
+        return True
 
     def set_status(self, new_status: str) -> None:
         self.status = UserStatus(new_status)
@@ -127,6 +185,7 @@ class AdminStatus(enum.Enum):
 
 class Admin(db.Model, Base):
     __tablename__ = 'admins'
+    __read_primary__ = True
     id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     status = Column(Enum(AdminStatus))
     time_created = Column(DateTime(timezone=True), server_default=func.now())
@@ -150,14 +209,26 @@ class Admin(db.Model, Base):
             info.append(device.info)
         return info
 
+    @property
+    def fullname(self) -> str:
+        return self.user.fullname
+
+    @property
+    def username(self) -> str:
+        return self.user.username
+
+    @property
+    def devices_count(self) -> int:
+        return len(self.devices)
+
     @property
     def info(self) -> dict:
         return {
             'id': self.id,
             'status': self.status.value,
-            'fullname': self.user.fullname,
-            'username': self.user.username,
-            'devices': len(self.devices),
+            'fullname': self.fullname,
+            'username': self.username,
+            'devices': self.devices_count,
             'time_created': self.time_created.isoformat()
         }
 
@@ -169,6 +240,48 @@ class Admin(db.Model, Base):
     def find_all(cls):
         return cls.query.all()
 
+    def set_status(self, new_status: str) -> None:
+        self.status = AdminStatus(new_status.lower())
+        self.update()
+
+    @classmethod
+    def delete_many(cls, ids: list) -> tuple:
+        revoked, keys = Device.delete_where(Device.admin_id.in_(ids))
+        admins = db.session.execute(delete(cls.__table__).where(cls.id.in_(ids)).returning(cls.id))
+        keys += [cls.cache_key(admin_id) for admin_id, in admins]
+        return revoked, keys
+
+    @classmethod
+    def find_existing_ids(cls, ids: list) -> list:
+        return [_id for _id, in db.session.query(cls.id).filter(cls.id.in_(ids))]
+
+    @classmethod
+    def query_info(cls):
+        """One row per admin with the user names and the devices count, grouped in the db"""
+        return db.session.query(
+            cls.id,
+            cls.status,
+            (User.first_name + ' ' + User.last_name).label('fullname'),
+            User.username,
+            func.count(Device.id).label('devices_count'),
+            cls.time_created
+        ).join(User, User.id == cls.id) \
+            .outerjoin(Device, Device.admin_id == cls.id) \
+            .group_by(cls.id, User.id) \
+            .order_by(cls.id)
+
+    @classmethod
+    def find_info_by_id(cls, _id: int):
+        return cls.query_info().filter(cls.id == _id).first()
+
+    @classmethod
+    def find_all_info(cls) -> list:
+        return cls.query_info().all()
+
+    @classmethod
+    def iter_all_info(cls, chunk_size: int):
+        return cls.query_info().yield_per(chunk_size)
+
 
 class DeviceStatus(enum.Enum):
     ENABLE = 'enable'
@@ -181,10 +294,15 @@ class DeviceStatus(enum.Enum):
 
 class Device(db.Model, Base):
     __tablename__ = 'devices'
+    __read_primary__ = True
+    __table_args__ = (
+        #  serves the ILIKE '%name%' of find_all_by_name, needs the pg_trgm extension
+        Index('ix_devices_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
     id = Column(Integer, primary_key=True)
-    admin_id = Column(Integer, ForeignKey('admins.id'))
+    admin_id = Column(Integer, ForeignKey('admins.id'), index=True)
     name = Column(String(80), nullable=False, unique=True)
-    key = Column(String(80), nullable=False)
+    key = Column(String(80), nullable=False, index=True)
     status = Column(Enum(DeviceStatus), default=DeviceStatus('enable'), nullable=False)
     requests = Column(Integer, default=0, nullable=False)
 
@@ -200,6 +318,25 @@ class Device(db.Model, Base):
     def __repr__(self):
         return f"device: {self.id}"
 
+    @staticmethod
+    def key_cache_key(key: str) -> str:
+        return f"devices:key:{key}"
+
+    @property
+    def cache_keys(self) -> list:
+        #  a refreshed key must stop working, so the replaced one is dropped as well
+        keys = {self.key, *inspect(self).attrs.key.history.deleted}
+        return super().cache_keys + [self.key_cache_key(key) for key in keys]
+
+    @classmethod
+    def delete_where(cls, *criteria) -> tuple:
+        revoked = Token.delete_where(Token.device_id.in_(select(cls.id).where(*criteria)))
+        devices = db.session.execute(delete(cls.__table__).where(*criteria).returning(cls.id, cls.key))
+        keys = list()
+        for device_id, key in devices:
+            keys += [cls.cache_key(device_id), cls.key_cache_key(key)]
+        return revoked, keys
+
     def refresh_key(self) -> None:
         self.key = uuid4().hex
         self.update()
@@ -238,6 +375,16 @@ class Device(db.Model, Base):
     def find_by_key(cls, key: str) -> db.Model:
         return cls.query.filter_by(key=key).first()
 
+    @classmethod
+    def add_requests(cls, requests: dict) -> None:
+        statement = update(cls.__table__) \
+            .where(cls.__table__.c.id == bindparam('device_id')) \
+            .values(requests=cls.__table__.c.requests + bindparam('amount'))
+        with db.engine.begin() as connection:
+            connection.execute(statement, [
+                {'device_id': device_id, 'amount': amount} for device_id, amount in requests.items()
+            ])
+
 
 class TokenStatus(enum.Enum):
     ACTIVE = 'active'
@@ -250,38 +397,57 @@ class TokenStatus(enum.Enum):
 
 class Token(db.Model, Base):
     __tablename__ = 'tokens'
+    __read_primary__ = True
+    __table_args__ = (
+        Index('ix_tokens_user_id_device_id', 'user_id', 'device_id'),
+    )
     id = Column(Integer, primary_key=True)
-    device_id = Column(Integer, ForeignKey('devices.id'))
+    device_id = Column(Integer, ForeignKey('devices.id'), index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    access_token = Column(Text, unique=True, nullable=False)
-    refresh_token = Column(Text, unique=True, nullable=False)
+    access_digest = Column(LargeBinary(32), unique=True, nullable=False)
+    refresh_digest = Column(LargeBinary(32), unique=True, nullable=False)
+    access_jti = Column(String(36))
     expires = db.Column(DateTime(timezone=True))
+    refresh_expires = db.Column(DateTime(timezone=True), nullable=False, index=True)
     status = db.Column(Enum(TokenStatus), default=TokenStatus('active'), nullable=False)
 
     user = relationship('User', back_populates='tokens', uselist=False)
     device = relationship('Device', back_populates='tokens', uselist=False)
 
-    def __init__(self, device_id: int, user_id: int, access_token: str, refresh_token: str, expires: datetime.datetime):
+    def __init__(self, device_id: int, user_id: int, access_token: str, access_jti: str, refresh_token: str,
+                 expires: datetime.datetime, refresh_expires: datetime.datetime):
         self.device_id = device_id
         self.user_id = user_id
-        self.access_token = access_token
-        self.refresh_token = refresh_token
+        self.access_digest = self.digest(access_token)
+        self.access_jti = access_jti
+        self.refresh_digest = self.digest(refresh_token)
         self.expires = expires
+        self.refresh_expires = refresh_expires
         self.upload()
 
     def __repr__(self):
         return f"token: {self.id}"
 
-    def update_data(self, access_token: str, refresh_token: str, expires: datetime.datetime):
-        self.access_token = access_token
-        self.refresh_token = refresh_token
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """Tokens are kept as fixed-width sha256, the JWT itself only lives on the client"""
+        return hashlib.sha256(token.encode('UTF-8')).digest()
+
+    def update_data(self, access_token: str, access_jti: str, refresh_token: str, expires: datetime.datetime,
+                    refresh_expires: datetime.datetime):
+        self.access_digest = self.digest(access_token)
+        self.access_jti = access_jti
+        self.refresh_digest = self.digest(refresh_token)
         self.expires = expires
+        self.refresh_expires = refresh_expires
         self.status = TokenStatus('active')
         self.update()
 
-    def update_access(self, access_token: str, expires: datetime.datetime):
-        self.access_token = access_token
+    def update_access(self, access_token: str, access_jti: str, expires: datetime.datetime):
+        self.access_digest = self.digest(access_token)
+        self.access_jti = access_jti
         self.expires = expires
+        self.status = TokenStatus('active')
         self.update()
 
     @property
@@ -290,16 +456,142 @@ class Token(db.Model, Base):
 
     @classmethod
     def find_by_access_token(cls, access_token: str) -> db.Model:
-        return cls.query.filter_by(access_token=access_token).first()
+        return cls.query.filter_by(access_digest=cls.digest(access_token)).first()
+
+    @classmethod
+    def find_identity(cls, access_token: str) -> db.Model:
+        """Token with its user, user's admin and device, all joined in one query"""
+        return cls.query \
+            .filter_by(access_digest=cls.digest(access_token)) \
+            .options(joinedload(cls.user).joinedload(User.admin), joinedload(cls.device)) \
+            .first()
 
     @classmethod
     def find_by_refresh_token(cls, refresh_token: str) -> db.Model:
-        return cls.query.filter_by(refresh_token=refresh_token).first()
+        return cls.query.filter_by(refresh_digest=cls.digest(refresh_token)).first()
 
     @classmethod
     def find_by_user_and_device(cls, user_id: int, device_id: int) -> db.Model:
         return cls.query.filter_by(user_id=user_id, device_id=device_id).first()
 
+    @classmethod
+    def revoke_where(cls, *criteria) -> list:
+        """Revokes live access tokens of matching sessions in one statement, returns their (jti, expires) pairs"""
+        live = select(cls.access_jti, cls.expires) \
+            .where(*criteria, cls.access_jti.isnot(None), cls.expires > func.now())
+        return db.session.execute(
+            insert(RevokedToken.__table__)
+            .from_select(['jti', 'expires'], live)
+            .on_conflict_do_nothing()
+            .returning(RevokedToken.jti, RevokedToken.expires)
+        ).all()
+
+    @classmethod
+    def delete_where(cls, *criteria) -> list:
+        """Deletes matching sessions and revokes their live access tokens in two statements"""
+        revoked = cls.revoke_where(*criteria)
+        db.session.execute(delete(cls.__table__).where(*criteria))
+        return revoked
+
+    @classmethod
+    def delete_expired(cls, batch_size: int) -> int:
+        """Deletes one batch of sessions whose refresh token has lapsed, returns the number of rows"""
+        batch = db.session.query(cls.id) \
+            .filter(cls.refresh_expires <= func.now()) \
+            .limit(batch_size) \
+            .with_for_update(skip_locked=True)
+        deleted = cls.query.filter(cls.id.in_(batch.scalar_subquery())).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
     def set_expired(self) -> None:
         self.status = TokenStatus('expired')
         self.update()
+
+
+class RevokedToken(db.Model, Base):
+    __tablename__ = 'revoked_tokens'
+    __read_primary__ = True
+    jti = Column(String(36), primary_key=True)
+    expires = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __init__(self, jti: str, expires: datetime.datetime):
+        self.jti = jti
+        self.expires = expires
+        self.upload()
+
+    def __repr__(self):
+        return f"revoked token: {self.jti}"
+
+    @classmethod
+    def find_active(cls) -> list:
+        return cls.query.filter(cls.expires > func.now()).all()
+
+    @classmethod
+    def delete_expired(cls, batch_size: int) -> int:
+        batch = db.session.query(cls.jti) \
+            .filter(cls.expires <= func.now()) \
+            .limit(batch_size) \
+            .with_for_update(skip_locked=True)
+        deleted = cls.query.filter(cls.jti.in_(batch.scalar_subquery())).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+class ImportStatus(enum.Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    @classmethod
+    def values(cls) -> list:
+        return [cls.PENDING.value, cls.RUNNING.value, cls.DONE.value, cls.FAILED.value]
+
+
+class ImportJob(db.Model, Base):
+    __tablename__ = 'import_jobs'
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))
+    status = Column(Enum(ImportStatus), default=ImportStatus('pending'), nullable=False)
+    received = Column(Integer, nullable=False)
+    uploaded = Column(Integer, default=0, nullable=False)
+    duplicated = Column(Integer, default=0, nullable=False)
+    invalid = Column(Integer, default=0, nullable=False)
+    error = Column(String(255))
+    time_created = Column(DateTime(timezone=True), server_default=func.now())
+    time_updated = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"import job: {self.id}"
+
+    @classmethod
+    def create(cls, user_id: int, received: int) -> str:
+        """Commits right away, even inside a request, the job thread and status polls must see the row"""
+        job_id = uuid4().hex
+        db.session.execute(insert(cls.__table__).values(
+            id=job_id, user_id=user_id, status=ImportStatus('pending'), received=received
+        ))
+        db.session.commit()
+        return job_id
+
+    @classmethod
+    def find_by_id(cls, _id: str) -> db.Model:
+        return cls.query.filter_by(id=_id).first()
+
+    def set_running(self) -> None:
+        self.status = ImportStatus('running')
+        self.update()
+
+    def finish(self, result: dict) -> None:
+        self.uploaded = result['uploaded']
+        self.duplicated = result['duplicated']
+        self.invalid = result['invalid']
+        self.status = ImportStatus('done')
+        self.update()
+
+    def fail(self, error: str) -> None:
+        db.session.rollback()
+        self.error = error[:255]
+        self.status = ImportStatus('failed')
+        self.update()
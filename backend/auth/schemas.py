@@ -1,5 +1,5 @@
 from marshmallow import Schema, fields, post_load, validate
-from .models import HumanGender, UserStatus, AdminStatus, DeviceStatus
+from .models import HumanGender, UserStatus, AdminStatus, DeviceStatus, ImportStatus
 from backend.utils import UnprocessableEntity
 
 
@@ -28,7 +28,7 @@ class DeviceSchema(Schema):
     id = fields.Int()
     admin_id = fields.Int()
     name = fields.Str()
-    status = fields.Str()
+    status = fields.Enum(DeviceStatus, by_value=True)
     key = fields.Str()
 
 
@@ -43,20 +43,24 @@ class SetAdminSchema(Schema):
 
 class AdminSchema(Schema):
     id = fields.Int()
-    status = fields.Str(validate=validate.OneOf(AdminStatus.values()))
+    status = fields.Enum(AdminStatus, by_value=True)
     fullname = fields.Str()
     username = fields.Str()
-    devices = fields.Int()
+    devices = fields.Int(attribute='devices_count')
     time_created = fields.DateTime()
 
 
+class AdminIdsSchema(Schema):
+    admin_ids = fields.List(fields.Int(), validate=validate.Length(1, 1000), required=True)
+
+
 class AdminsSchema(Schema):
     admins = fields.List(fields.Nested(AdminSchema))
 
 
 class FullAdminSchema(Schema):
     id = fields.Int()
-    status = fields.Str()
+    status = fields.Enum(AdminStatus, by_value=True)
     fullname = fields.Str()
     username = fields.Str()
     devices = fields.List(fields.Nested(DeviceSchema))
@@ -100,6 +104,18 @@ class NewUsersSchema(Schema):
     users = fields.List(fields.Nested(NewUserSchema))
 
 
+class ImportJobSchema(Schema):
+    id = fields.Str()
+    status = fields.Enum(ImportStatus, by_value=True)
+    received = fields.Int()
+    uploaded = fields.Int()
+    duplicated = fields.Int()
+    invalid = fields.Int()
+    error = fields.Str()
+    time_created = fields.DateTime()
+    time_updated = fields.DateTime()
+
+
 class DetailUserSchema(Schema):
     username = fields.Str(validate=[validate.Length(1, 50), validate.Regexp(r"^[a-zA-Z0-9_]+$")])
     email = fields.Email(validate=validate.Length(0, 100))
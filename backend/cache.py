@@ -0,0 +1,300 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time
+from os import getpid
+import fcntl
+import json
+import mmap
+import struct
+import zlib
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CacheBackend(ABC):
+    """Key-value store of JSON-ready values with per-entry ttl in seconds"""
+
+    @abstractmethod
+    def get(self, key: str, default=None):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, key: str, func, ttl: float):
+        """Atomically replaces the value with func(value or None) and returns the new one"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class LRUTTLCache(CacheBackend):
+    """Bounded in-process cache, a fallback when workers cannot share one"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.__data = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key: str, default=None):
+        with self.__lock:
+            entry = self.__data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= monotonic():
+                del self.__data[key]
+                return default
+            self.__data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        with self.__lock:
+            self.__data[key] = (monotonic() + ttl, value)
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self.__lock:
+            for key in keys:
+                self.__data.pop(key, None)
+
+    def update(self, key: str, func, ttl: float):
+        with self.__lock:
+            entry = self.__data.get(key)
+            value = func(entry[1] if entry and entry[0] > monotonic() else None)
+            self.__data[key] = (monotonic() + ttl, value)
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+            return value
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__data.clear()
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+
+class SharedMemoryCache(CacheBackend):
+    """Fixed-slot hash table in a memory-mapped file, shared by all workers of one host
+
+    A key owns slot crc32(key) % slots, a colliding key simply overwrites it.
+    Values which do not fit into `slot_size` bytes are not cached.
+    """
+    header = struct.Struct('dI')
+
+    def __init__(self, path: str, slots: int = 4096, slot_size: int = 4096):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.__file = None
+        self.__map = None
+        self.__pid = None
+        self.__lock = Lock()
+
+    def __open(self) -> mmap.mmap:
+        #  flock is held per open file, so every forked worker opens its own
+        if self.__pid != getpid():
+            self.__file = open(self.path, 'a+b')
+            size = self.slots * self.slot_size
+            if self.__file.seek(0, 2) < size:
+                self.__file.truncate(size)
+            self.__map = mmap.mmap(self.__file.fileno(), size)
+            self.__pid = getpid()
+        return self.__map
+
+    def __offset(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.slots * self.slot_size
+
+    def __read(self, memory: mmap.mmap, offset: int):
+        expires, length = self.header.unpack_from(memory, offset)
+        if not length or expires <= time():
+            return None
+        start = offset + self.header.size
+        return json.loads(memory[start:start + length])
+
+    def get(self, key: str, default=None):
+        with self.__lock:
+            memory = self.__open()
+            fcntl.flock(self.__file, fcntl.LOCK_SH)
+            try:
+                entry = self.__read(memory, self.__offset(key))
+            finally:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+        if entry is None or entry[0] != key:
+            return default
+        return entry[1]
+
+    def __write(self, memory: mmap.mmap, offset: int, key: str, value, ttl: float) -> None:
+        payload = json.dumps([key, value]).encode()
+        if self.header.size + len(payload) > self.slot_size:
+            return
+        self.header.pack_into(memory, offset, time() + ttl, len(payload))
+        memory[offset + self.header.size:offset + self.header.size + len(payload)] = payload
+
+    def set(self, key: str, value, ttl: float) -> None:
+        offset = self.__offset(key)
+        with self.__lock:
+            memory = self.__open()
+            fcntl.flock(self.__file, fcntl.LOCK_EX)
+            try:
+                self.__write(memory, offset, key, value, ttl)
+            finally:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+
+    def update(self, key: str, func, ttl: float):
+        offset = self.__offset(key)
+        with self.__lock:
+            memory = self.__open()
+            fcntl.flock(self.__file, fcntl.LOCK_EX)
+            try:
+                entry = self.__read(memory, offset)
+                value = func(entry[1] if entry is not None and entry[0] == key else None)
+                self.__write(memory, offset, key, value, ttl)
+            finally:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+        return value
+
+    def delete(self, *keys: str) -> None:
+        with self.__lock:
+            memory = self.__open()
+            fcntl.flock(self.__file, fcntl.LOCK_EX)
+            try:
+                for key in keys:
+                    offset = self.__offset(key)
+                    entry = self.__read(memory, offset)
+                    if entry is not None and entry[0] == key:
+                        self.header.pack_into(memory, offset, 0, 0)
+            finally:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        with self.__lock:
+            memory = self.__open()
+            fcntl.flock(self.__file, fcntl.LOCK_EX)
+            try:
+                for slot in range(self.slots):
+                    self.header.pack_into(memory, slot * self.slot_size, 0, 0)
+            finally:
+                fcntl.flock(self.__file, fcntl.LOCK_UN)
+
+
+class RedisCache(CacheBackend):
+    """Any server speaking the Redis protocol, shared by workers of all hosts"""
+
+    def __init__(self, url: str, prefix: str = ''):
+        if redis is None:
+            raise RuntimeError('redis cache backend needs the redis package')
+        self.prefix = prefix
+        self.__client = redis.Redis.from_url(url)
+
+    def get(self, key: str, default=None):
+        value = self.__client.get(self.prefix + key)
+        if value is None:
+            return default
+        return json.loads(value)
+
+    def set(self, key: str, value, ttl: float) -> None:
+        self.__client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.__client.delete(*[self.prefix + key for key in keys])
+
+    def update(self, key: str, func, ttl: float):
+        name = self.prefix + key
+
+        def transaction(pipe):
+            current = pipe.get(name)
+            value = func(None if current is None else json.loads(current))
+            pipe.multi()
+            pipe.set(name, json.dumps(value), px=int(ttl * 1000))
+            return value
+
+        #  WATCH based, retried by redis-py when another client changed the key meanwhile
+        return self.__client.transaction(transaction, name, value_from_callable=True)
+
+    def clear(self) -> None:
+        for key in self.__client.scan_iter(match=f'{self.prefix}*'):
+            self.__client.delete(key)
+
+
+def create_backend(kind: str, config, path: str) -> CacheBackend:
+    if kind == 'redis':
+        return RedisCache(config['CACHE_URL'], prefix=config['CACHE_PREFIX'])
+    if kind == 'shared':
+        return SharedMemoryCache(path, slots=config['CACHE_SIZE'], slot_size=config['CACHE_SLOT_SIZE'])
+    if kind == 'local':
+        return LRUTTLCache(maxsize=config['CACHE_SIZE'])
+    raise ValueError(f"cache backend: {kind} is not one of local, shared, redis")
+
+
+class Cache:
+    """Application cache, the backend is picked by CACHE_BACKEND: local, shared or redis"""
+
+    def __init__(self):
+        self.backend = LRUTTLCache()
+        self.ttl = 60.0
+
+    def init_app(self, app) -> None:
+        self.backend = create_backend(app.config['CACHE_BACKEND'], app.config, app.config['CACHE_PATH'])
+        self.ttl = app.config['CACHE_TTL']
+
+    def get(self, key: str, default=None):
+        return self.backend.get(key, default)
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        self.backend.set(key, value, self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys: str) -> None:
+        self.backend.delete(*keys)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+class DenyList:
+    """Local snapshot of revoked token ids, reloaded at most every `refresh` seconds"""
+
+    def __init__(self, refresh: float = 5.0):
+        self.refresh = refresh
+        self.__items = dict()
+        self.__loaded = None
+        self.__lock = Lock()
+
+    def init_app(self, app, prefix: str) -> None:
+        self.refresh = app.config.get(f'{prefix}_REFRESH', self.refresh)
+        self.__items = dict()
+        self.__loaded = None
+
+    def add(self, jti: str, expires: float) -> None:
+        with self.__lock:
+            self.__items[jti] = expires
+
+    def contains(self, jti: str, loader) -> bool:
+        """`loader` returns (jti, expires timestamp) pairs of the active revocations"""
+        if self.__loaded is None or monotonic() - self.__loaded >= self.refresh:
+            items = dict(loader())
+            with self.__lock:
+                self.__items = items
+                self.__loaded = monotonic()
+        expires = self.__items.get(jti)
+        return expires is not None and expires > time()
+
+
+cache = Cache()
+token_deny_list = DenyList()
@@ -0,0 +1,90 @@
+from flask import request, Response
+import gzip
+
+from .cache import LRUTTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compressor:
+    """Compresses JSON responses after the request, keeping the bytes of versioned ones
+
+    Responses carrying an ETag are stored per (etag, encoding), a repeat hit of an
+    unchanged resource is answered by `lookup` without serializing or compressing again.
+    """
+    mimetypes = ('application/json', 'application/x-ndjson')
+
+    def __init__(self, min_size: int = 500, level: int = 6, brotli_level: int = 4,
+                 cache_size: int = 0, cache_ttl: float = 300.0):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_level = brotli_level
+        self.cache_ttl = cache_ttl
+        self.__cache = LRUTTLCache(maxsize=cache_size) if cache_size else None
+
+    def init_app(self, app) -> None:
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.brotli_level = app.config.get('COMPRESS_BROTLI_LEVEL', self.brotli_level)
+        self.cache_ttl = app.config.get('COMPRESS_CACHE_TTL', self.cache_ttl)
+        cache_size = app.config.get('COMPRESS_CACHE_SIZE', 0)
+        self.__cache = LRUTTLCache(maxsize=cache_size) if cache_size else None
+        app.after_request(self.compress)
+
+    @property
+    def encodings(self) -> tuple:
+        return ('br', 'gzip') if brotli else ('gzip',)
+
+    def negotiate(self) -> str:
+        """Best encoding the client accepts, None for identity"""
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accepted.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def encode(self, data: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_level)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def lookup(self, etag: str, headers: dict) -> Response:
+        """Precompressed response for `etag` in an accepted encoding, None if not stored"""
+        if self.__cache is None:
+            return None
+        encoding = self.negotiate()
+        data = self.__cache.get(f'{etag}:{encoding}') if encoding else None
+        if data is None:
+            return None
+        response = Response(data, status=200, headers=headers, mimetype=self.mimetypes[0])
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def compress(self, response: Response) -> Response:
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or response.mimetype not in self.mimetypes or 'Content-Encoding' in response.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = self.negotiate()
+        if len(data) < self.min_size or not encoding:
+            return response
+
+        compressed = self.encode(data, encoding)
+        etag, _ = response.get_etag()
+        if etag and self.__cache is not None:
+            self.__cache.set(f'{etag}:{encoding}', compressed, self.cache_ttl)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+compressor = Compressor()
@@ -1,4 +1,5 @@
-from os import getenv
+from os import getenv, path, cpu_count
+from tempfile import gettempdir
 
 
 class Config:
@@ -6,8 +7,67 @@ class Config:
     CSRF_ENABLED = True
     CORS_ENABLED = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_POOL_SLOW_CHECKOUT = float(getenv('DB_POOL_SLOW_CHECKOUT', 0.1))
+    DB_STATEMENT_TIMEOUT = int(getenv('DB_STATEMENT_TIMEOUT', 0))
+    DB_PGBOUNCER = getenv('DB_PGBOUNCER', 'false').lower() == 'true'
+    SQLALCHEMY_BINDS = {}
+    UNIT_OF_WORK = getenv('UNIT_OF_WORK', 'true').lower() == 'true'
+    REPLICA_STICKY_SECONDS = int(getenv('REPLICA_STICKY_SECONDS', 5))
     SECRET_KEY = getenv('SECRET_KEY')
+    SERVER_MODE = getenv('SERVER_MODE', 'sync')
+    WORKERS = int(getenv('WORKERS', (cpu_count() or 1) * 2 + 1))
     JWT_SECRET_KEY = getenv('JWT_SECRET_KEY')
+    #  stateless checks trust the role and status claims of an access token for its 5 minutes,
+    #  freezing a user or changing admin rights revokes the tokens, other workers see it within JWT_DENY_LIST_REFRESH
+    JWT_STATELESS = getenv('JWT_STATELESS', 'false').lower() == 'true'
+    JWT_DENY_LIST_REFRESH = float(getenv('JWT_DENY_LIST_REFRESH', 5))
+    CACHE_BACKEND = getenv('CACHE_BACKEND', 'local')
+    CACHE_URL = getenv('CACHE_URL', 'redis://localhost:6379/0')
+    CACHE_PATH = getenv('CACHE_PATH', path.join(gettempdir(), 'popina-cache'))
+    CACHE_PREFIX = getenv('CACHE_PREFIX', 'popina:')
+    CACHE_SIZE = int(getenv('CACHE_SIZE', 4096))
+    CACHE_SLOT_SIZE = int(getenv('CACHE_SLOT_SIZE', 8192))
+    CACHE_TTL = float(getenv('CACHE_TTL', 60))
+    API_KEY_CACHE_TTL = float(getenv('API_KEY_CACHE_TTL', 30))
+    REQUEST_COUNTER_FLUSH_INTERVAL = float(getenv('REQUEST_COUNTER_FLUSH_INTERVAL', 10))
+    STREAM_CHUNK_SIZE = int(getenv('STREAM_CHUNK_SIZE', 500))
+    BULK_IMPORT_CHUNK_SIZE = int(getenv('BULK_IMPORT_CHUNK_SIZE', 1000))
+    JOB_WORKERS = int(getenv('JOB_WORKERS', 1))
+    #  postings of the rarest pantry ingredients read in full per pantry search, the rest is read by recipe size
+    PANTRY_CANDIDATES = int(getenv('PANTRY_CANDIDATES', 5000))
+    LOG_LEVEL = getenv('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(getenv('LOG_SAMPLE_RATE', 1))
+    #  empty writes to stderr, a file is shared by all workers and rotated outside, e.g. by logrotate
+    LOG_FILE = getenv('LOG_FILE', '')
+    #  clients share API keys (the frontend has one), limits are a guard against runaway clients
+    RATE_LIMIT_ENABLED = getenv('RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+    RATE_LIMIT_BACKEND = getenv('RATE_LIMIT_BACKEND', 'shared' if CACHE_BACKEND == 'local' else CACHE_BACKEND)
+    RATE_LIMIT_PATH = getenv('RATE_LIMIT_PATH', path.join(gettempdir(), 'popina-ratelimit'))
+    RATE_LIMIT_DEVICE = getenv('RATE_LIMIT_DEVICE', '500/1000')
+    RATE_LIMIT_DEVICE_OVERRIDES = getenv('RATE_LIMIT_DEVICE_OVERRIDES', '{}')
+    RATE_LIMIT_USER = getenv('RATE_LIMIT_USER', '50/100')
+    METRICS_ENABLED = getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_URL = getenv('METRICS_URL', '/metrics')
+    METRICS_DIR = getenv('METRICS_DIR', path.join(gettempdir(), 'popina-metrics'))
+    METRICS_FLUSH_INTERVAL = float(getenv('METRICS_FLUSH_INTERVAL', 5))
+    COMPRESS_MIN_SIZE = int(getenv('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(getenv('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_LEVEL = int(getenv('COMPRESS_BROTLI_LEVEL', 4))
+    COMPRESS_CACHE_SIZE = int(getenv('COMPRESS_CACHE_SIZE', 256))
+    COMPRESS_CACHE_TTL = float(getenv('COMPRESS_CACHE_TTL', 300))
+    TOKEN_SWEEP_BATCH_SIZE = int(getenv('TOKEN_SWEEP_BATCH_SIZE', 1000))
+    BCRYPT_LOG_ROUNDS = int(getenv('BCRYPT_LOG_ROUNDS', 12))
+    #  requests wait on the hasher, it sheds load with 503 under sync workers but frees none of them
+    PASSWORD_HASHER_POOL = getenv('PASSWORD_HASHER_POOL', 'process' if SERVER_MODE == 'gevent' else 'thread')
+    PASSWORD_HASHER_WORKERS = int(getenv('PASSWORD_HASHER_WORKERS', 2))
+    PASSWORD_HASHER_QUEUE_SIZE = int(getenv('PASSWORD_HASHER_QUEUE_SIZE', 16))
+    PASSWORD_HASHER_QUEUE_TIMEOUT = float(getenv('PASSWORD_HASHER_QUEUE_TIMEOUT', 2))
+    PASSWORD_HASHER_BULK_SLOTS = int(getenv('PASSWORD_HASHER_BULK_SLOTS', max(1, PASSWORD_HASHER_QUEUE_SIZE // 4)))
     # MAIL_SERVER = getenv('MAIL_SERVER')
     # MAIL_PORT = getenv('MAIL_PORT')
     # MAIL_USERNAME = getenv('MAIL_USERNAME')
@@ -19,6 +79,9 @@ class Config:
 class ProductionConfig(Config):
     ENV = 'production'
     SQLALCHEMY_DATABASE_URI = getenv('PROD_DB')
+    SQLALCHEMY_BINDS = {'replica': getenv('PROD_REPLICA_DB')} if getenv('PROD_REPLICA_DB') else {}
+    LOG_LEVEL = getenv('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(getenv('LOG_SAMPLE_RATE', 0.1))
     CORS_ENABLED = True
 
 
@@ -26,6 +89,8 @@ class DevelopmentConfig(Config):
     ENV = 'development'
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = getenv('DEV_DB')
+    SQLALCHEMY_BINDS = {'replica': getenv('DEV_REPLICA_DB')} if getenv('DEV_REPLICA_DB') else {}
+    LOG_LEVEL = getenv('LOG_LEVEL', 'DEBUG')
     SQLALCHEMY_TRACK_MODIFICATIONS = True
     CORS_ENABLED = True
 
@@ -0,0 +1,67 @@
+from collections import Counter
+from threading import Event, Lock, Thread
+from os import getpid
+import atexit
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCounter:
+    """Sums device requests in memory and flushes them to the db in batches"""
+
+    def __init__(self, flush_interval: float = 10.0):
+        self.flush_interval = flush_interval
+        self.__pending = Counter()
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__app = None
+        self.__pid = None
+
+    def init_app(self, app) -> None:
+        self.flush_interval = app.config.get('REQUEST_COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.__app = app
+        atexit.register(self.stop)
+
+    def add(self, device_id: int, amount: int = 1) -> None:
+        with self.__lock:
+            self.__pending[device_id] += amount
+        self.__ensure_worker()
+
+    def flush(self) -> None:
+        with self.__lock:
+            pending, self.__pending = self.__pending, Counter()
+        if not pending or not self.__app:
+            return
+
+        from backend.auth.models import Device
+        try:
+            with self.__app.app_context():
+                Device.add_requests(pending)
+        except Exception as error:
+            logger.error('device requests flush failed: %s', error)
+            with self.__lock:
+                self.__pending.update(pending)
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.flush()
+
+    def __ensure_worker(self) -> None:
+        #  started lazily, so every forked gunicorn worker owns its flushing thread
+        if self.__pid == getpid():
+            return
+        with self.__lock:
+            if self.__pid == getpid():
+                return
+            self.__pid = getpid()
+            self.__stopped.clear()
+        Thread(target=self.__run, name='request-counter', daemon=True).start()
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.flush_interval):
+            self.flush()
+
+
+request_counter = RequestCounter()
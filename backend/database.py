@@ -1,13 +1,78 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask import request, has_request_context, g, current_app, jsonify
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from flask_migrate import Migrate
+from sqlalchemy import event, orm, inspect
+from sqlalchemy.pool import QueuePool, NullPool
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter, time
+import logging
 
-db = SQLAlchemy()
+from .cache import cache
+
+REPLICA_BIND = 'replica'
+REPLICA_METHODS = ('GET', 'HEAD')
+PRIMARY_COOKIE = 'read_primary_until'
+
+
+def replica_allowed() -> bool:
+    if not has_request_context() or request.method not in REPLICA_METHODS:
+        return False
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) < time()
+    except ValueError:
+        return True
+
+
+def read_primary(mapper) -> bool:
+    """Models with `__read_primary__` set are always read from the primary, like sessions and revocations"""
+    return mapper is not None and getattr(mapper.class_, '__read_primary__', False)
+
+
+class RoutingSession(SignallingSession):
+    """Sends reads of safe requests to the replica bind, writes and everything else to the primary
+
+    Authentication reads stay on the primary, a lagging replica would reject fresh tokens and accept revoked ones.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if REPLICA_BIND in self.app.config['SQLALCHEMY_BINDS'] and replica_allowed() and not read_primary(mapper) \
+                and not unit_of_work.pending and not (self._flushing or self.new or self.dirty or self.deleted):
+            return db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 migrate = Migrate()
+logger = logging.getLogger(__name__)
 
 
 class Base:
+    @classmethod
+    def cache_key(cls, _id) -> str:
+        return f"{cls.__tablename__}:{_id}"
+
+    @property
+    def cache_keys(self) -> list:
+        """Cache entries built from this row, dropped whenever it changes"""
+        _id = getattr(self, 'id', None)
+        return [self.cache_key(_id)] if _id is not None else []
+
     def update(self):
+        keys = self.cache_keys
+        if unit_of_work.active:
+            #  new rows are flushed right away, callers read their ids
+            if inspect(self).pending:
+                db.session.flush()
+            unit_of_work.defer(keys)
+            return self
         db.session.commit()
+        cache.delete(*keys)
         return self
 
     def upload(self):
@@ -18,3 +83,164 @@ class Base:
         db.session.delete(self)
         self.update()
         return
+
+    @staticmethod
+    def commit_deleted(keys: list) -> None:
+        """Commits set-based deletes and drops the cache entries of the removed rows"""
+        if unit_of_work.active:
+            unit_of_work.defer(keys)
+            return
+        db.session.commit()
+        cache.delete(*keys)
+
+
+class UnitOfWork:
+    """One transaction per request, Base writes only flush and the request commits once at its end
+
+    Responses below 500 commit, server errors and unhandled exceptions roll back.
+    Outside of a request, in the cli or background threads, Base writes commit right away.
+    """
+
+    def __init__(self):
+        self.enabled = False
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config['UNIT_OF_WORK']
+        if not self.enabled:
+            return
+        app.after_request(self.commit)
+        app.teardown_request(self.rollback)
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and has_request_context()
+
+    @property
+    def pending(self) -> bool:
+        return self.active and 'unit_of_work_keys' in g
+
+    def defer(self, keys: list) -> None:
+        """Cache entries to drop once the request has committed"""
+        g.setdefault('unit_of_work_keys', set()).update(keys)
+
+    @contextmanager
+    def savepoint(self):
+        """Steps of a multi-step operation, a failure rolls back to here and the request goes on"""
+        if not self.active:
+            yield
+            return
+        g.setdefault('unit_of_work_keys', set())
+        with db.session.begin_nested():
+            yield
+
+    def commit(self, response):
+        if not self.pending:
+            return response
+        keys = g.pop('unit_of_work_keys')
+        if response.status_code >= 500:
+            db.session.rollback()
+            return response
+        try:
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            current_app.logger.error('request transaction failed: %s', error)
+            response = jsonify(message='request transaction failed')
+            response.status_code = 500
+            return response
+        cache.delete(*keys)
+        return response
+
+    def rollback(self, exception=None) -> None:
+        if exception is not None and g.pop('unit_of_work_keys', None) is not None:
+            db.session.rollback()
+
+
+unit_of_work = UnitOfWork()
+
+
+class PoolMetrics:
+    """Connection checkout counters of the current worker"""
+
+    def __init__(self, slow_checkout: float = 0.1):
+        self.slow_checkout = slow_checkout
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.__lock = Lock()
+
+    def observe(self, wait: float, pool) -> None:
+        with self.__lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        if wait >= self.slow_checkout:
+            logger.warning('waited %.3fs for db connection, in use: %s', wait, pool.checkedout())
+
+    def stats(self, pool) -> dict:
+        return {
+            'checkouts': self.checkouts,
+            'wait_seconds_total': self.wait_total,
+            'wait_seconds_max': self.wait_max,
+            'in_use': pool.checkedout() if isinstance(pool, QueuePool) else None,
+            'size': pool.size() if isinstance(pool, QueuePool) else None,
+            'overflow': pool.overflow() if isinstance(pool, QueuePool) else None
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeasuredQueuePool(QueuePool):
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.observe(perf_counter() - started, self)
+
+
+def engine_options(config) -> dict:
+    if config['DB_PGBOUNCER']:
+        #  pgbouncer in transaction mode does the pooling and does not accept startup options
+        return {'poolclass': NullPool}
+
+    options = {
+        'poolclass': MeasuredQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+    if config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+
+def init_pool(app) -> None:
+    pool_metrics.slow_checkout = app.config['DB_POOL_SLOW_CHECKOUT']
+    statement_timeout = app.config['DB_STATEMENT_TIMEOUT']
+    if not app.config['DB_PGBOUNCER'] or not statement_timeout:
+        return
+
+    with app.app_context():
+        engine = db.get_engine()
+
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+        #  transaction scoped, so nothing leaks to the next client of the server connection
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout)}")
+
+
+def init_replica(app) -> None:
+    if REPLICA_BIND not in app.config['SQLALCHEMY_BINDS']:
+        return
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.after_request
+    def stick_to_primary(response):
+        #  the client reads its own writes from the primary until the replica has caught up
+        if request.method not in REPLICA_METHODS and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, str(time() + sticky_seconds), max_age=sticky_seconds, httponly=True)
+        return response
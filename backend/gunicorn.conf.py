@@ -0,0 +1,49 @@
+from os import getenv, environ, path
+from tempfile import gettempdir
+from shutil import rmtree
+import multiprocessing
+
+#  sync    - one request per worker process, the old behaviour
+#  threads - gthread workers, THREADS requests per worker
+#  gevent  - cooperative workers, WORKER_CONNECTIONS requests per worker
+SERVER_MODES = {
+    'sync': 'sync',
+    'threads': 'gthread',
+    'gevent': 'gevent'
+}
+
+server_mode = getenv('SERVER_MODE', 'sync')
+if server_mode not in SERVER_MODES:
+    raise ValueError(f"SERVER_MODE: {server_mode} is not one of {', '.join(SERVER_MODES)}")
+
+bind = f"0.0.0.0:{getenv('PORT', 5000)}"
+workers = int(getenv('WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = SERVER_MODES[server_mode]
+#  a request keeps its db connection until it ends, requests beyond the pool wait DB_POOL_TIMEOUT and fail
+db_connections = int(getenv('DB_POOL_SIZE', 5)) + int(getenv('DB_MAX_OVERFLOW', 5))
+threads = int(getenv('THREADS', 8)) if server_mode == 'threads' else 1
+#  gevent serves every connection it accepts at once, gthread only keeps idle ones alive
+worker_connections = int(getenv('WORKER_CONNECTIONS', db_connections if server_mode == 'gevent' else 1000))
+concurrency = worker_connections if server_mode == 'gevent' else threads
+if concurrency > db_connections:
+    raise ValueError(f"SERVER_MODE: {server_mode} serves {concurrency} requests per worker, "
+                     f"more than DB_POOL_SIZE + DB_MAX_OVERFLOW: {db_connections}")
+timeout = int(getenv('WORKER_TIMEOUT', 30))
+reload = getenv('APP_MODE') == 'dev'
+
+if server_mode == 'gevent':
+    #  greenlets share one OS thread, so bcrypt must not run on a (patched) thread pool
+    environ.setdefault('PASSWORD_HASHER_POOL', 'process')
+
+
+def on_starting(server):
+    #  /metrics sums the files of all workers, the ones of a previous run must not count. The master
+    #  must not import backend: its locks and queues would be created before gevent workers patch them.
+    #  The default matches Config.METRICS_DIR.
+    rmtree(getenv('METRICS_DIR', path.join(gettempdir(), 'popina-metrics')), ignore_errors=True)
+
+
+def post_fork(server, worker):
+    if server_mode == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
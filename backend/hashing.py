@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+from os import getpid
+import bcrypt
+
+from .utils import HashingError
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('UTF-8'), bcrypt.gensalt(rounds)).decode('UTF-8')
+
+
+def _verify(password_hash: str, password: str) -> bool:
+    return bcrypt.checkpw(password.encode('UTF-8'), password_hash.encode('UTF-8'))
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated pool with a bounded queue instead of the request thread
+
+    The request still waits for the result, so a sync worker is taken for the whole hash just as before,
+    there the pool only caps the hashes running at once and answers 503 once the queue stays full
+    for `queue_timeout`. Other requests of the worker go on meanwhile only under threads or gevent,
+    gevent needs the process pool for that, a thread would hold its hub.
+    """
+
+    def __init__(self, rounds: int = 12, pool: str = 'thread', workers: int = 2,
+                 queue_size: int = 16, queue_timeout: float = 2.0, bulk_slots: int = 4):
+        self.rounds = rounds
+        self.pool = pool
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.bulk_slots = bulk_slots
+        self.__slots = BoundedSemaphore(queue_size)
+        self.__bulk_slots = BoundedSemaphore(bulk_slots)
+        self.__executor = None
+        self.__pid = None
+        self.__lock = Lock()
+
+    def init_app(self, app) -> None:
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        self.pool = app.config.get('PASSWORD_HASHER_POOL', self.pool)
+        self.workers = app.config.get('PASSWORD_HASHER_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_HASHER_QUEUE_SIZE', self.queue_size)
+        self.queue_timeout = app.config.get('PASSWORD_HASHER_QUEUE_TIMEOUT', self.queue_timeout)
+        self.bulk_slots = app.config.get('PASSWORD_HASHER_BULK_SLOTS', max(1, self.queue_size // 4))
+        if not 0 < self.bulk_slots < self.queue_size:
+            raise ValueError(f"PASSWORD_HASHER_BULK_SLOTS: {self.bulk_slots} must be above 0 "
+                             f"and below the queue size {self.queue_size}")
+        self.__slots = BoundedSemaphore(self.queue_size)
+        self.__bulk_slots = BoundedSemaphore(self.bulk_slots)
+        self.__executor = None
+        self.__pid = None
+
+    @property
+    def executor(self):
+        #  pools do not survive a fork, every gunicorn worker builds its own
+        if self.__pid != getpid():
+            with self.__lock:
+                if self.__pid != getpid():
+                    executor_class = ProcessPoolExecutor if self.pool == 'process' else ThreadPoolExecutor
+                    self.__executor = executor_class(max_workers=self.workers)
+                    self.__pid = getpid()
+        return self.__executor
+
+    def __submit(self, func, *args, timeout: float = None):
+        if not self.__slots.acquire(timeout=timeout):
+            raise HashingError('too many password operations, try again later', 503)
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self.__slots.release()
+            raise
+        future.add_done_callback(lambda _: self.__slots.release())
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.__submit(_hash, password, self.rounds, timeout=self.queue_timeout).result()
+
+    def hash_many(self, passwords: list) -> list:
+        """Waits for free slots instead of failing, meant for background imports
+
+        At most `bulk_slots` of the queue are held at once, the rest stays free for logins.
+        """
+        futures = list()
+        for password in passwords:
+            self.__bulk_slots.acquire()
+            try:
+                future = self.__submit(_hash, password, self.rounds)
+            except Exception:
+                self.__bulk_slots.release()
+                raise
+            future.add_done_callback(lambda _: self.__bulk_slots.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self.__submit(_verify, password_hash, password, timeout=self.queue_timeout).result()
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        #  bcrypt hashes look like $2b$<rounds>$<salt and digest>
+        return int(password_hash.split('$')[2]) != self.rounds
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from os import getpid
+import logging
+
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """Runs long jobs like bulk imports on a small thread pool of the worker, off the request and its timeout
+
+    Jobs live in the worker that accepted them, a worker restarted mid-job leaves its job unfinished.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.__app = None
+        self.__executor = None
+        self.__pid = None
+        self.__lock = Lock()
+
+    def init_app(self, app) -> None:
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.__app = app
+        self.__executor = None
+        self.__pid = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        #  pools do not survive a fork, every gunicorn worker builds its own
+        if self.__pid != getpid():
+            with self.__lock:
+                if self.__pid != getpid():
+                    self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+                    self.__pid = getpid()
+        return self.__executor
+
+    def submit(self, func, *args):
+        return self.executor.submit(self.__run, func, *args)
+
+    def __run(self, func, *args) -> None:
+        with self.__app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('job %s failed', func.__qualname__)
+            finally:
+                db.session.remove()
+
+
+job_runner = JobRunner()
@@ -0,0 +1,125 @@
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from flask import has_request_context, request
+from datetime import datetime, timezone
+from threading import Lock
+from os import getpid
+from queue import SimpleQueue
+import atexit
+import json
+import logging
+import random
+import sys
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, runs on the listener thread"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('method', 'path', 'remote_addr'):
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the records below WARNING, warnings and errors always pass"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class RequestQueueHandler(QueueHandler):
+    """Hands records to the listener without formatting them on the request thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        #  models may be expired or bound to this thread's session, plain values are left lazy
+        if isinstance(record.args, tuple):
+            record.args = tuple(arg if isinstance(arg, (str, int, float, type(None))) else str(arg)
+                                for arg in record.args)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.remote_addr = request.remote_addr
+        return record
+
+
+class LogPipeline:
+    """Root logging through a queue, a listener thread per worker writes JSON lines to stderr or LOG_FILE"""
+
+    def __init__(self):
+        self.queue = SimpleQueue()
+        self.__handlers = []
+        self.__listener = None
+        self.__pid = None
+        self.__stopped_pid = None
+        self.__queue_handler = None
+        self.__lock = Lock()
+
+    def init_app(self, app) -> None:
+        #  workers never rotate, a rename by one would leave the others writing to the old file
+        if app.config['LOG_FILE']:
+            handler = WatchedFileHandler(app.config['LOG_FILE'], delay=True)
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        self.__handlers = [handler]
+
+        queue_handler = RequestQueueHandler(self.queue)
+        queue_handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATE']))
+        queue_handler.addFilter(self.__ensure_listener)
+        self.__queue_handler = queue_handler
+
+        root = logging.getLogger()
+        for handler in [handler for handler in root.handlers if isinstance(handler, RequestQueueHandler)]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(app.config['LOG_LEVEL'])
+        app.logger.setLevel(app.config['LOG_LEVEL'])
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Drains the queue at exit, records logged afterwards are written on the calling thread"""
+        with self.__lock:
+            self.__stopped_pid = getpid()
+            listener = self.__listener if self.__pid == getpid() else None
+            self.__listener = None
+        if listener:
+            listener.stop()
+
+    def __write(self, record: logging.LogRecord) -> None:
+        record = self.__queue_handler.prepare(record)
+        for handler in self.__handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def __ensure_listener(self, record: logging.LogRecord) -> bool:
+        #  a stopped pipeline stays stopped, a new thread could not be joined during interpreter shutdown
+        if self.__stopped_pid == getpid():
+            self.__write(record)
+            return False
+        #  started lazily, so every forked gunicorn worker owns its writing thread
+        if self.__pid != getpid():
+            with self.__lock:
+                if self.__pid != getpid():
+                    self.__listener = QueueListener(self.queue, *self.__handlers, respect_handler_level=True)
+                    self.__listener.start()
+                    self.__pid = getpid()
+        return True
+
+
+log_pipeline = LogPipeline()
@@ -1,13 +1,21 @@
-from flask import request
+from flask import request, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 from itsdangerous import URLSafeTimedSerializer
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as Base64Error
 from os import getenv
 import json
 
 from . import models
-# from backend.utils import
+from . import schemas
+from backend.cache import cache
+from backend.utils import RecipeError, dump, make_etag
+
+
+#  query params of a recipes page, the rest of the endpoint kwargs are the caller's identity
+PAGE_PARAMS = ('cursor', 'limit', 'complexity', 'cooking_time_min', 'cooking_time_max', 'user_id')
 
 
 class RecipeController:
@@ -21,6 +29,7 @@ class RecipeController:
             complexity=recipe_data['complexity'],
             cooking_time=recipe_data['cooking_time'],
             instruction=recipe_data['instruction'],
+            ingredients=recipe_data['ingredients']
         )
         return new_recipe
 
@@ -36,14 +45,101 @@ class RecipeController:
             recipe.cooking_time = recipe_data['cooking_time']
         if recipe_data['instruction'] != '':
             recipe.instruction = recipe_data['instruction']
+        if recipe_data['ingredients'] is not None:
+            recipe.set_ingredients(recipe_data['ingredients'])
         recipe.update()
         return recipe
 
     def get_recipe(self, recipe_id: int) -> __model:
         return self.__model.find_by_id(recipe_id)
 
-    def get_all_recipes(self) -> dict:
-        recipes = list()
-        for recipe in self.__model.find_all():
-            recipes.append(recipe.info)
-        return {'recipes': recipes}
+    def get_recipe_version(self, recipe_id: int) -> tuple:
+        version = self.__model.find_version(recipe_id)
+        if not version:
+            return None
+        return make_etag('recipe', version.id, version.modified), version.modified
+
+    @staticmethod
+    def get_recipes_version(filters: dict, page: dict) -> tuple:
+        """ETag of the fetched page: its query params and the ids and changes of the rows on it
+
+        No Last-Modified, a row leaving the page does not move the newest change of the rest.
+        """
+        rows = [(recipe.id, recipe.time_updated or recipe.time_created) for recipe in page['recipes']]
+        etag = make_etag('recipes', *(filters[param] for param in PAGE_PARAMS), *rows, page['next_cursor'])
+        return etag, None
+
+    def get_recipe_info(self, recipe_id: int) -> dict:
+        key = self.__model.cache_key(recipe_id)
+        info = cache.get(key)
+        if info is None:
+            recipe = self.get_recipe(recipe_id)
+            if not recipe:
+                return None
+            info = dump(schemas.FullRecipeSchema, recipe)
+            cache.set(key, info)
+        return info
+
+    @staticmethod
+    def encode_cursor(recipe: __model) -> str:
+        position = f"{recipe.time_created.isoformat()}|{recipe.id}"
+        return urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            time_created, recipe_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(time_created), int(recipe_id)
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            raise RecipeError(f"cursor: {cursor} is not valid", 400)
+
+    def __page_filters(self, filters: dict) -> dict:
+        return {
+            'cursor': self.decode_cursor(filters['cursor']) if filters['cursor'] else None,
+            'complexity': filters['complexity'],
+            'cooking_time_min': filters['cooking_time_min'],
+            'cooking_time_max': filters['cooking_time_max'],
+            'user_id': filters['user_id']
+        }
+
+    def get_recipes_page(self, filters: dict) -> dict:
+        limit = filters['limit']
+        recipes = self.__model.find_page(limit=limit + 1, **self.__page_filters(filters))
+
+        next_cursor = None
+        if len(recipes) > limit:
+            recipes = recipes[:limit]
+            next_cursor = self.encode_cursor(recipes[-1])
+
+        return {'recipes': recipes, 'next_cursor': next_cursor}
+
+    def iter_recipes(self, filters: dict, chunk_size: int):
+        return self.__model.iter_page(chunk_size, **self.__page_filters(filters))
+
+    def search_recipes(self, search_data: dict) -> dict:
+        limit, offset = search_data['limit'], search_data['offset']
+        found = self.__model.search(search_data['q'], limit=limit + 1, offset=offset)
+
+        next_offset = None
+        if len(found) > limit:
+            found = found[:limit]
+            next_offset = offset + limit
+
+        return {'recipes': found, 'next_offset': next_offset}
+
+    def find_cookable_recipes(self, pantry_data: dict) -> dict:
+        limit, offset = pantry_data['limit'], pantry_data['offset']
+        ingredient_ids = models.Ingredient.find_ids(pantry_data['pantry'])
+        if not ingredient_ids:
+            return {'recipes': [], 'next_offset': None}
+
+        found = self.__model.find_cookable(ingredient_ids, limit=limit + 1, offset=offset,
+                                           max_missing=pantry_data['max_missing'],
+                                           candidates=current_app.config['PANTRY_CANDIDATES'])
+
+        next_offset = None
+        if len(found) > limit:
+            found = found[:limit]
+            next_offset = offset + limit
+
+        return {'recipes': found, 'next_offset': next_offset}
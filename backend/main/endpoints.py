@@ -4,8 +4,10 @@ from flask_apispec.views import MethodResource
 from . import controllers
 from . import schemas
 from backend.auth import controllers as auth_controllers
+from backend.compression import compressor
 from backend.utils import (UserError, TokenError, DeviceError, AdminError, RecipeError, MailController,
-                           error_handler, ep_responses, device_header, user_header)
+                           error_handler, ep_responses, device_header, user_header,
+                           streaming_requested, stream_json, dump, not_modified, validators)
 
 
 api_required = auth_controllers.DeviceController.api_required
@@ -22,7 +24,7 @@ class AddRecipeApi(MethodResource):
     __schemas = {
         'request': schemas.NewRecipeSchema,
         'contribution': schemas.DetailRecipeSchema,
-        'response': schemas.RecipeSchema
+        'response': schemas.FullRecipeSchema
     }
     decorators = [
         user_required,
@@ -36,15 +38,15 @@ class AddRecipeApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(422, "not valid schema")]))
     @use_kwargs(__schemas['request'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def post(self, **recipe_data):
         current_user = recipe_data['current_user']
 
         new_recipe = self.__controller.create_recipe(recipe_data, current_user.id)
 
-        response = self.__schemas['response']().load(new_recipe.info)
+        response = dump(self.__schemas['response'], new_recipe)
 
-        current_app.logger.info(f"{current_user} created {new_recipe}")
+        current_app.logger.info("%s created %s", current_user, new_recipe)
 
         return response, 201
 
@@ -54,7 +56,7 @@ class AddRecipeApi(MethodResource):
          security=[device_header, user_header],
          responses=ep_responses([(404, "recipe_id does not exist")]))
     @use_kwargs(__schemas['contribution'], location='form')
-    @marshal_with(__schemas['response'], code=201)
+    @marshal_with(__schemas['response'], code=201, apply=False)
     def put(self, **recipe_data):
         current_user = recipe_data['current_user']
 
@@ -63,9 +65,9 @@ class AddRecipeApi(MethodResource):
             raise RecipeError(f"recipe: {recipe_data['id']} not found")
 
         updated_recipe = self.__controller.change_recipe_field(recipe_data, recipe)
-        response = self.__schemas['response']().load(updated_recipe.info)
+        response = dump(self.__schemas['response'], updated_recipe)
 
-        current_app.logger.info(f"{current_user} updated {recipe}")
+        current_app.logger.info("%s updated %s", current_user, recipe)
 
         return response, 201
 
@@ -76,7 +78,7 @@ class AddRecipeApi(MethodResource):
 class RecipeApi(MethodResource):
     __controller = controllers.RecipeController()
     __schemas = {
-        'response': schemas.RecipeSchema
+        'response': schemas.FullRecipeSchema
     }
     decorators = [
         user_required,
@@ -86,26 +88,35 @@ class RecipeApi(MethodResource):
 
     @doc(tags=[MAIN],
          summary='returns Recipe info',
-         description='Receives recipe_id',
+         description='Receives recipe_id, honours If-None-Match and If-Modified-Since',
          security=[device_header, user_header],
-         responses=ep_responses([(404, "recipe not found")]))
-    @marshal_with(__schemas['response'], code=200)
+         responses=ep_responses([(304, "recipe not modified"),
+                                 (404, "recipe not found")]))
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, recipe_id, **kwargs):
         current_user = kwargs['current_user']
 
-        recipe = self.__controller.get_recipe(recipe_id)
-        if not recipe:
+        version = self.__controller.get_recipe_version(recipe_id)
+        if not version:
             raise RecipeError(f"recipe: {recipe_id} not found", 404)
 
-        response = self.__schemas['response']().load(recipe.info)
-        current_app.logger.info(f"sent to {current_user} info of {recipe}")
+        cached = not_modified(*version) or compressor.lookup(version[0], validators(*version))
+        if cached:
+            return cached
 
-        return response, 200
+        response = self.__controller.get_recipe_info(recipe_id)
+        if not response:
+            raise RecipeError(f"recipe: {recipe_id} not found", 404)
+
+        current_app.logger.info("sent to %s info of recipe: %s", current_user, recipe_id)
+
+        return response, 200, validators(*version)
 
 
 class RecipesApi(MethodResource):
     __controller = controllers.RecipeController()
     __schemas = {
+        'request': schemas.RecipesQuerySchema,
         'response': schemas.RecipesSchema
     }
     decorators = [
@@ -116,17 +127,93 @@ class RecipesApi(MethodResource):
 
     @doc(tags=[MAIN],
          summary='returns Recipes info',
-         description='sends list of recipe entities',
-         security=[device_header, user_header])
-    @marshal_with(__schemas['response'], code=200)
+         description='sends page of recipe entities, newest first, filtered by complexity, '
+                     'cooking time range and author; next page is requested with returned cursor; '
+                     'all matching recipes are streamed with stream=true or Accept: application/x-ndjson; '
+                     'honours If-None-Match and If-Modified-Since',
+         security=[device_header, user_header],
+         responses=ep_responses([(304, "recipes not modified"),
+                                 (400, "cursor is not valid")]))
+    @use_kwargs(__schemas['request'], location='query')
+    @marshal_with(__schemas['response'], code=200, apply=False)
     def get(self, **kwargs):
         current_user = kwargs['current_user']
 
-        result = self.__controller.get_all_recipes()
-        response = self.__schemas['response']().load(result)
+        if streaming_requested():
+            current_app.logger.info("streams to %s recipes info", current_user)
+            recipes = self.__controller.iter_recipes(kwargs, current_app.config['STREAM_CHUNK_SIZE'])
+            return stream_json('recipes', recipes, schemas.RecipeSchema)
+
+        result = self.__controller.get_recipes_page(kwargs)
+        version = self.__controller.get_recipes_version(kwargs, result)
+        cached = not_modified(*version) or compressor.lookup(version[0], validators(*version))
+        if cached:
+            return cached
+
+        response = dump(self.__schemas['response'], result)
+
+        current_app.logger.info("sent to %s page of recipes info", current_user)
+
+        return response, 200, validators(*version)
+
 
-        current_app.logger.info(f"sent to {current_user} all recipes info")
+class RecipeSearchApi(MethodResource):
+    __controller = controllers.RecipeController()
+    __schemas = {
+        'request': schemas.RecipeSearchSchema,
+        'response': schemas.FoundRecipesSchema
+    }
+    decorators = [
+        user_required,
+        api_required,
+        error_handler
+    ]
+
+    @doc(tags=[MAIN],
+         summary='searches Recipes',
+         description='Receives search text, sends page of recipe entities ranked by relevance '
+                     'of title, description and instruction',
+         security=[device_header, user_header],
+         responses=ep_responses([(422, "not valid query")]))
+    @use_kwargs(__schemas['request'], location='query')
+    @marshal_with(__schemas['response'], code=200, apply=False)
+    def get(self, **kwargs):
+        current_user = kwargs['current_user']
+
+        result = self.__controller.search_recipes(kwargs)
+        response = dump(self.__schemas['response'], result)
+
+        current_app.logger.info("sent to %s recipes found by: %s", current_user, kwargs['q'])
 
         return response, 200
 
 
+class RecipePantryApi(MethodResource):
+    __controller = controllers.RecipeController()
+    __schemas = {
+        'request': schemas.RecipePantrySchema,
+        'response': schemas.CookableRecipesSchema
+    }
+    decorators = [
+        user_required,
+        api_required,
+        error_handler
+    ]
+
+    @doc(tags=[MAIN],
+         summary='finds Recipes cookable from a pantry',
+         description='Receives pantry ingredients as repeated pantry params, sends page of recipes sharing '
+                     'any of them, fewest missing ingredients and highest coverage first',
+         security=[device_header, user_header],
+         responses=ep_responses([(422, "not valid query")]))
+    @use_kwargs(__schemas['request'], location='query')
+    @marshal_with(__schemas['response'], code=200, apply=False)
+    def get(self, **kwargs):
+        current_user = kwargs['current_user']
+
+        result = self.__controller.find_cookable_recipes(kwargs)
+        response = dump(self.__schemas['response'], result)
+
+        current_app.logger.info("sent to %s recipes cookable from %s ingredients", current_user, len(kwargs['pantry']))
+
+        return response, 200
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Enum, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Enum, ForeignKey, Index, Computed, tuple_, \
+    delete, select, update, or_, and_, true
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from flask_bcrypt import generate_password_hash, check_password_hash
 from uuid import uuid4
@@ -21,6 +23,13 @@ class RecipeComplexity(enum.Enum):
 
 class Recipe(db.Model, Base):
     __tablename__ = 'recipes'
+    __table_args__ = (
+        Index('ix_recipes_time_created_id', 'time_created', 'id'),
+        Index('ix_recipes_complexity_time_created_id', 'complexity', 'time_created', 'id'),
+        Index('ix_recipes_user_id_time_created_id', 'user_id', 'time_created', 'id'),
+        Index('ix_recipes_cooking_time', 'cooking_time'),
+        Index('ix_recipes_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -29,11 +38,21 @@ class Recipe(db.Model, Base):
     complexity = Column(Enum(RecipeComplexity), nullable=False)
     cooking_time = Column(Integer, nullable=False)
     instruction = Column(Text, nullable=False)
+    ingredients_count = Column(Integer, nullable=False, default=0, server_default='0')
     time_created = Column(DateTime(timezone=True), server_default=func.now())
     time_updated = Column(DateTime(timezone=True), onupdate=func.now())
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', description), 'B') || "
+        "setweight(to_tsvector('english', instruction), 'C')",
+        persisted=True
+    )))
+
+    ingredients = relationship('Ingredient', secondary='recipe_ingredients', order_by='Ingredient.name',
+                               viewonly=True)
 
     def __init__(self, user_id: int, title: str, description: str,
-                 complexity: str, cooking_time: int, instruction: str):
+                 complexity: str, cooking_time: int, instruction: str, ingredients: list = None):
         self.user_id = user_id
         self.title = title
         self.description = description
@@ -41,6 +60,8 @@ class Recipe(db.Model, Base):
         self.cooking_time = cooking_time
         self.instruction = instruction
         self.upload()
+        if ingredients:
+            self.set_ingredients(ingredients)
 
     def __repr__(self):
         return f"recipe: {self.id}"
@@ -66,7 +87,212 @@ class Recipe(db.Model, Base):
     def find_all(cls) -> list:
         return cls.query.all()
 
+    @classmethod
+    def modified(cls):
+        return func.coalesce(cls.time_updated, cls.time_created)
+
+    @classmethod
+    def find_version(cls, _id: int):
+        return db.session.query(cls.id, cls.modified().label('modified')).filter(cls.id == _id).first()
+
+    @classmethod
+    def find_page(cls, limit: int, **filters) -> list:
+        return cls.query_page(**filters).limit(limit).all()
+
+    @classmethod
+    def iter_page(cls, chunk_size: int, **filters):
+        return cls.query_page(**filters).yield_per(chunk_size)
+
+    @classmethod
+    def query_page(cls, cursor: tuple = None, complexity: str = None, cooking_time_min: int = None,
+                   cooking_time_max: int = None, user_id: int = None):
+        query = cls.query
+        if complexity:
+            query = query.filter(cls.complexity == RecipeComplexity(complexity))
+        if cooking_time_min is not None:
+            query = query.filter(cls.cooking_time >= cooking_time_min)
+        if cooking_time_max is not None:
+            query = query.filter(cls.cooking_time <= cooking_time_max)
+        if user_id is not None:
+            query = query.filter(cls.user_id == user_id)
+        if cursor:
+            query = query.filter(tuple_(cls.time_created, cls.id) < tuple_(*cursor))
+        return query.order_by(cls.time_created.desc(), cls.id.desc())
+
+    @classmethod
+    def search(cls, text: str, limit: int, offset: int = 0) -> list:
+        ts_query = func.websearch_to_tsquery('english', text)
+        rank = func.ts_rank_cd(cls.search_vector, ts_query).label('rank')
+        return db.session.query(cls, rank) \
+            .filter(cls.search_vector.op('@@')(ts_query)) \
+            .order_by(rank.desc(), cls.id.desc()) \
+            .offset(offset) \
+            .limit(limit) \
+            .all()
+
+    @property
+    def ingredient_names(self) -> list:
+        return [ingredient.name for ingredient in self.ingredients]
+
+    @classmethod
+    def find_cookable(cls, ingredient_ids: list, limit: int, offset: int = 0, max_missing: int = None,
+                      candidates: int = 5000) -> list:
+        """(Recipe, matched, missing, coverage) rows, fewest missing ingredients first, exactly ranked
+
+        Reads the (ingredient_id, recipe_id) primary key of recipe_ingredients as an inverted index.
+        Every recipe of the rarest pantry ingredients, up to `candidates` postings, is ranked first.
+        A recipe reached only through the common rest, like salt, matches no more pantry ingredients
+        than it shares with that rest, so only the postings of recipes small enough to still reach
+        the first rows are read, through the ingredients_count copied into them.
+        """
+        rare, common, reach = [], [], 0
+        for ingredient_id, recipes_count in Ingredient.find_rarity(ingredient_ids):
+            reach += recipes_count
+            (rare if reach <= candidates or not rare else common).append(ingredient_id)
+
+        top = limit + offset
+        found = cls.rank_cookable(ingredient_ids, RecipeIngredient.ingredient_id.in_(rare), top, max_missing)
+        if common:
+            #  recipes reached through the common rest alone make the first rows only with `bound` missing or less
+            bounds = [found[-1][2]] if len(found) == top else []
+            bounds += [max_missing] if max_missing is not None else []
+            if not bounds:
+                reachable = RecipeIngredient.ingredient_id.in_(common)
+            else:
+                bound = min(bounds)
+                #  a recipe whose rarest common pantry ingredient is common[i] shares at most
+                #  len(common) - i ingredients with the pantry outside the rare ones
+                reachable = or_(*[
+                    and_(RecipeIngredient.ingredient_id == ingredient_id,
+                         RecipeIngredient.ingredients_count <= bound + len(common) - i)
+                    for i, ingredient_id in enumerate(common)
+                ])
+            found += cls.rank_cookable(ingredient_ids, reachable, top, max_missing)
+
+        ranked = {recipe.id: (recipe, matched, missing, coverage) for recipe, matched, missing, coverage in found}
+        ranked = sorted(ranked.values(), key=lambda row: (row[2], -row[3], -row[0].id))
+        return ranked[offset:top]
+
+    @classmethod
+    def rank_cookable(cls, ingredient_ids: list, postings, limit: int, max_missing: int = None) -> list:
+        """The first `limit` cookable rows among the recipes with a posting matching `postings`"""
+        candidate = select(RecipeIngredient.recipe_id).where(postings).distinct().subquery('candidates')
+        #  counted per candidate, through its own postings, the pantry postings of other recipes stay unread
+        matches = select(func.count().label('matched')) \
+            .where(RecipeIngredient.recipe_id == candidate.c.recipe_id,
+                   RecipeIngredient.ingredient_id.in_(ingredient_ids)) \
+            .lateral('matches')
+        missing = (cls.ingredients_count - matches.c.matched).label('missing')
+        coverage = (matches.c.matched * 1.0 / cls.ingredients_count).label('coverage')
+        query = db.session.query(cls, matches.c.matched, missing, coverage) \
+            .join(candidate, candidate.c.recipe_id == cls.id) \
+            .join(matches, true())
+        if max_missing is not None:
+            query = query.filter(cls.ingredients_count - matches.c.matched <= max_missing)
+        return query \
+            .order_by(missing, coverage.desc(), cls.id.desc()) \
+            .limit(limit) \
+            .all()
+
     def set_complexity(self, complexity: str) -> None:
         self.complexity = RecipeComplexity(complexity)
-        self.update()
         return
+
+    def set_ingredients(self, names: list) -> None:
+        """Replaces the ingredient list, unknown ingredients are created on the way"""
+        ingredient_ids = Ingredient.find_or_create_ids(names)
+        removed = db.session.execute(
+            delete(RecipeIngredient.__table__)
+            .where(RecipeIngredient.recipe_id == self.id)
+            .returning(RecipeIngredient.ingredient_id)
+        )
+        removed = {ingredient_id for ingredient_id, in removed}
+        if ingredient_ids:
+            db.session.execute(insert(RecipeIngredient.__table__).values(
+                [{'recipe_id': self.id, 'ingredient_id': ingredient_id, 'ingredients_count': len(ingredient_ids)}
+                 for ingredient_id in ingredient_ids]
+            ))
+        Ingredient.count_recipes(removed - set(ingredient_ids), -1)
+        Ingredient.count_recipes(set(ingredient_ids) - removed, 1)
+        self.ingredients_count = len(ingredient_ids)
+        #  the row changes even when only the list did, so ETags and cached info follow
+        self.time_updated = func.now()
+        db.session.expire(self, ['ingredients'])
+        self.update()
+
+
+class Ingredient(db.Model, Base):
+    __tablename__ = 'ingredients'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(80), nullable=False, unique=True)
+    #  recipes using the ingredient, it ranks pantry ingredients by rarity in Recipe.find_cookable
+    recipes_count = Column(Integer, nullable=False, default=0, server_default='0')
+    time_created = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"ingredient: {self.name}"
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return ' '.join(name.lower().split())
+
+    @classmethod
+    def normalize_all(cls, names: list) -> list:
+        return sorted({cls.normalize(name) for name in names if name.strip()})
+
+    @classmethod
+    def find_ids(cls, names: list) -> list:
+        names = cls.normalize_all(names)
+        if not names:
+            return []
+        return [_id for _id, in db.session.query(cls.id).filter(cls.name.in_(names))]
+
+    @classmethod
+    def find_or_create_ids(cls, names: list) -> list:
+        names = cls.normalize_all(names)
+        if not names:
+            return []
+        db.session.execute(insert(cls.__table__).values([{'name': name} for name in names]).on_conflict_do_nothing())
+        return cls.find_ids(names)
+
+    @classmethod
+    def find_rarity(cls, ids: list) -> list:
+        """(id, recipes_count) pairs, rarest first"""
+        return db.session.query(cls.id, cls.recipes_count) \
+            .filter(cls.id.in_(ids)) \
+            .order_by(cls.recipes_count, cls.id) \
+            .all()
+
+    @classmethod
+    def count_recipes(cls, ids: set, step: int) -> None:
+        if not ids:
+            return
+        db.session.execute(
+            update(cls.__table__).where(cls.id.in_(ids)).values(recipes_count=cls.recipes_count + step)
+        )
+
+    @classmethod
+    def uncount_recipes(cls, recipes) -> None:
+        """Takes the ingredients of the selected recipes off their counts, before the recipes are deleted"""
+        postings = select(RecipeIngredient.ingredient_id, func.count().label('recipes')) \
+            .where(RecipeIngredient.recipe_id.in_(recipes)) \
+            .group_by(RecipeIngredient.ingredient_id) \
+            .subquery()
+        db.session.execute(
+            update(cls.__table__)
+            .where(cls.id == postings.c.ingredient_id)
+            .values(recipes_count=cls.recipes_count - postings.c.recipes)
+        )
+
+
+class RecipeIngredient(db.Model):
+    __tablename__ = 'recipe_ingredients'
+    __table_args__ = (
+        Index('ix_recipe_ingredients_ingredient_id_ingredients_count', 'ingredient_id', 'ingredients_count',
+              'recipe_id'),
+    )
+    #  the primary key leads with ingredient_id, it is the ingredient -> recipes inverted index
+    ingredient_id = Column(Integer, ForeignKey('ingredients.id', ondelete='CASCADE'), primary_key=True)
+    recipe_id = Column(Integer, ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True, index=True)
+    #  Recipe.ingredients_count, so the recipes of a common ingredient are read smallest first
+    ingredients_count = Column(Integer, nullable=False, default=0, server_default='0')
@@ -9,6 +9,8 @@ class NewRecipeSchema(Schema):
     complexity = fields.Str(validate=validate.OneOf(RecipeComplexity.values()), required=True)
     cooking_time = fields.Int(required=True)
     instruction = fields.Str(required=True)
+    ingredients = fields.List(fields.Str(validate=validate.Length(1, 80)), validate=validate.Length(max=100),
+                              load_default=list)
 
 
 class DetailRecipeSchema(Schema):
@@ -18,6 +20,7 @@ class DetailRecipeSchema(Schema):
     complexity = fields.Str(validate=validate.OneOf(RecipeComplexity.values()))
     cooking_time = fields.Int()
     instruction = fields.Str(validate=[validate.Regexp(r"^[a-zA-Z0-9- ]+$")])
+    ingredients = fields.List(fields.Str(validate=validate.Length(1, 80)), validate=validate.Length(max=100))
 
     @post_load
     def prepare_data(self, in_data, **kwargs):
@@ -26,8 +29,9 @@ class DetailRecipeSchema(Schema):
         in_data['complexity'] = in_data.get('complexity', '')
         in_data['cooking_time'] = in_data.get('cooking_time', '')
         in_data['instruction'] = in_data.get('instruction', '')
+        in_data['ingredients'] = in_data.get('ingredients')
         if in_data['title'] == in_data['description'] == in_data['complexity'] \
-                == in_data['cooking_time'] == in_data['instruction'] == '':
+                == in_data['cooking_time'] == in_data['instruction'] == '' and in_data['ingredients'] is None:
             raise UnprocessableEntity
         return in_data
 
@@ -37,11 +41,94 @@ class RecipeSchema(Schema):
     user_id = fields.Int()
     title = fields.Str()
     description = fields.Str()
-    complexity = fields.Str()
+    complexity = fields.Enum(RecipeComplexity, by_value=True)
     cooking_time = fields.Int()
     instruction = fields.Str()
     time_created = fields.DateTime()
 
 
+class FullRecipeSchema(RecipeSchema):
+    ingredients = fields.List(fields.Str(), attribute='ingredient_names')
+
+
 class RecipesSchema(Schema):
     recipes = fields.List(fields.Nested(RecipeSchema))
+    next_cursor = fields.Str(allow_none=True)
+
+
+class RecipesQuerySchema(Schema):
+    limit = fields.Int(validate=validate.Range(1, 100))
+    cursor = fields.Str()
+    complexity = fields.Str(validate=validate.OneOf(RecipeComplexity.values()))
+    cooking_time_min = fields.Int(validate=validate.Range(min=0))
+    cooking_time_max = fields.Int(validate=validate.Range(min=0))
+    user_id = fields.Int()
+
+    @post_load
+    def prepare_data(self, in_data, **kwargs):
+        in_data['limit'] = in_data.get('limit', 20)
+        in_data['cursor'] = in_data.get('cursor', '')
+        in_data['complexity'] = in_data.get('complexity', '')
+        in_data['cooking_time_min'] = in_data.get('cooking_time_min')
+        in_data['cooking_time_max'] = in_data.get('cooking_time_max')
+        in_data['user_id'] = in_data.get('user_id')
+        return in_data
+
+
+class FoundRecipeSchema(RecipeSchema):
+    rank = fields.Float()
+
+    def get_attribute(self, obj, attr, default):
+        #  dumps (Recipe, rank) rows of Recipe.search
+        if attr == 'rank':
+            return obj.rank
+        return super().get_attribute(obj.Recipe, attr, default)
+
+
+class FoundRecipesSchema(Schema):
+    recipes = fields.List(fields.Nested(FoundRecipeSchema))
+    next_offset = fields.Int(allow_none=True)
+
+
+class RecipeSearchSchema(Schema):
+    q = fields.Str(validate=validate.Length(1, 200), required=True)
+    limit = fields.Int(validate=validate.Range(1, 100))
+    offset = fields.Int(validate=validate.Range(min=0))
+
+    @post_load
+    def prepare_data(self, in_data, **kwargs):
+        in_data['q'] = in_data.get('q').strip()
+        in_data['limit'] = in_data.get('limit', 20)
+        in_data['offset'] = in_data.get('offset', 0)
+        return in_data
+
+
+class CookableRecipeSchema(RecipeSchema):
+    matched = fields.Int()
+    missing = fields.Int()
+    coverage = fields.Float()
+
+    def get_attribute(self, obj, attr, default):
+        #  dumps (Recipe, matched, missing, coverage) rows of Recipe.find_cookable
+        if attr in ('matched', 'missing', 'coverage'):
+            return getattr(obj, attr)
+        return super().get_attribute(obj.Recipe, attr, default)
+
+
+class CookableRecipesSchema(Schema):
+    recipes = fields.List(fields.Nested(CookableRecipeSchema))
+    next_offset = fields.Int(allow_none=True)
+
+
+class RecipePantrySchema(Schema):
+    pantry = fields.List(fields.Str(validate=validate.Length(1, 80)), validate=validate.Length(1, 100), required=True)
+    max_missing = fields.Int(validate=validate.Range(min=0))
+    limit = fields.Int(validate=validate.Range(1, 100))
+    offset = fields.Int(validate=validate.Range(min=0))
+
+    @post_load
+    def prepare_data(self, in_data, **kwargs):
+        in_data['max_missing'] = in_data.get('max_missing')
+        in_data['limit'] = in_data.get('limit', 20)
+        in_data['offset'] = in_data.get('offset', 0)
+        return in_data
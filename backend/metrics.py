@@ -0,0 +1,261 @@
+from flask import request, g, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from time import perf_counter
+from os import getpid, kill, listdir, makedirs, path, replace
+import atexit
+import json
+import logging
+
+from .database import db, pool_metrics
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_COUNTERS = ('checkouts', 'wait_seconds_total')
+
+logger = logging.getLogger(__name__)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, counts: list, total: float) -> None:
+        self.counts = [count + other for count, other in zip(self.counts, counts)]
+        self.sum += total
+
+    def lines(self, name: str, labels: str) -> list:
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {total}')
+        lines.append(f'{name}_sum{{{labels.rstrip(",")}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels.rstrip(",")}}} {total}')
+        return lines
+
+
+class Metrics:
+    """Request latency, auth and SQL histograms in Prometheus text format, summed over all workers
+
+    Every worker writes its series to <METRICS_DIR>/<pid>.json each METRICS_FLUSH_INTERVAL seconds and
+    a scrape, served by any worker, sums all files. Files of exited workers keep counting, so counters
+    stay monotonic across worker restarts; gunicorn empties the directory when it starts.
+    """
+    histograms = {
+        'popina_request_seconds': ('Request latency', LATENCY_BUCKETS),
+        'popina_request_auth_seconds': ('Time spent in auth decorators', LATENCY_BUCKETS),
+        'popina_request_handler_seconds': ('Request latency without auth decorators', LATENCY_BUCKETS),
+        'popina_request_db_seconds': ('Time spent executing SQL per request', LATENCY_BUCKETS),
+        'popina_request_queries': ('SQL statements executed per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self.directory = None
+        self.flush_interval = 5.0
+        self.__series = {name: dict() for name in self.histograms}
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__app = None
+        self.__pid = None
+
+    def init_app(self, app, decorators: list = ()) -> None:
+        """`decorators` wrap the scrape view like the `decorators` of a resource, innermost first"""
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.__app = app
+        makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        view = self.export
+        for decorator in decorators:
+            view = decorator(view)
+        app.add_url_rule(app.config['METRICS_URL'], 'metrics', view)
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+        atexit.register(self.stop)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        self.__ensure_flusher()
+        with self.__lock:
+            series = self.__series[name]
+            if key not in series:
+                series[key] = Histogram(self.histograms[name][1])
+            series[key].observe(value)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times an auth decorator, its share is taken out of the handler latency"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            if has_request_context() and 'metrics_started' in g:
+                g.metrics_auth += elapsed
+                self.observe('popina_request_auth_seconds', elapsed, route=self.route(), stage=name)
+
+    @staticmethod
+    def route() -> str:
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    def start_request(self) -> None:
+        g.metrics_started = perf_counter()
+        g.metrics_auth = 0.0
+        g.metrics_queries = 0
+        g.metrics_db = 0.0
+
+    def finish_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        elapsed = perf_counter() - g.metrics_started
+        labels = {'method': request.method, 'route': self.route()}
+        self.observe('popina_request_seconds', elapsed, status=str(response.status_code), **labels)
+        self.observe('popina_request_handler_seconds', elapsed - g.metrics_auth, **labels)
+        self.observe('popina_request_db_seconds', g.metrics_db, **labels)
+        self.observe('popina_request_queries', g.metrics_queries, **labels)
+        return response
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_started', []).append(perf_counter())
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        pending = conn.info.get('metrics_query_started')
+        if not pending:
+            return
+        started = pending.pop()
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_db += perf_counter() - started
+
+    @staticmethod
+    def handle_error(context):
+        pending = context.connection.info.get('metrics_query_started') if context.connection else None
+        if pending:
+            pending.pop()
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            series = {
+                name: [[list(key), histogram.counts, histogram.sum] for key, histogram in series.items()]
+                for name, series in self.__series.items()
+            }
+        with self.__app.app_context():
+            pool = pool_metrics.stats(db.engine.pool)
+        return {'series': series, 'pool': pool}
+
+    def flush(self) -> None:
+        """Replaces the file of this worker in one rename, a scrape never reads half of it"""
+        if not self.directory or self.__pid != getpid():
+            return
+        file = path.join(self.directory, f'{getpid()}.json')
+        try:
+            with open(f'{file}.tmp', 'w') as snapshot:
+                json.dump(self.snapshot(), snapshot)
+            replace(f'{file}.tmp', file)
+        except OSError as error:
+            logger.error('metrics flush failed: %s', error)
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.flush()
+
+    def collect(self) -> tuple:
+        """Series and pool counters of every worker that has run, pool gauges of the running ones"""
+        self.flush()
+        series = {name: dict() for name in self.histograms}
+        pool = dict()
+        for file in listdir(self.directory):
+            if not file.endswith('.json'):
+                continue
+            try:
+                with open(path.join(self.directory, file)) as snapshot:
+                    data = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+
+            for name, rows in data['series'].items():
+                if name not in series:
+                    continue
+                for labels, counts, total in rows:
+                    key = tuple(tuple(label) for label in labels)
+                    if key not in series[name]:
+                        series[name][key] = Histogram(self.histograms[name][1])
+                    series[name][key].merge(counts, total)
+
+            alive = process_alive(int(file[:-len('.json')]))
+            for field, value in data['pool'].items():
+                if value is None:
+                    continue
+                if field in POOL_COUNTERS:
+                    pool[field] = pool.get(field, 0) + value
+                elif field == 'wait_seconds_max':
+                    pool[field] = max(pool.get(field, 0), value)
+                elif alive:
+                    pool[field] = pool.get(field, 0) + value
+        return series, pool
+
+    def render(self) -> str:
+        series, pool = self.collect()
+        lines = []
+        for name, (description, _) in self.histograms.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for key, histogram in sorted(series[name].items()):
+                labels = ''.join(f'{label}="{value}",' for label, value in key)
+                lines += histogram.lines(name, labels)
+
+        for field, value in pool.items():
+            name = f'popina_db_pool_{field}'
+            kind = 'counter' if field in POOL_COUNTERS else 'gauge'
+            lines += [f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def export(self, **kwargs) -> Response:
+        return Response(self.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+    def __ensure_flusher(self) -> None:
+        #  started lazily, so every forked gunicorn worker owns its flushing thread and its series
+        if self.__pid == getpid():
+            return
+        with self.__lock:
+            if self.__pid == getpid():
+                return
+            if self.__pid is not None:
+                #  a fork copied the series of the parent, they are in the parent's file already
+                self.__series = {name: dict() for name in self.histograms}
+            self.__pid = getpid()
+            self.__stopped.clear()
+        Thread(target=self.__run, name='metrics-flush', daemon=True).start()
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.flush_interval):
+            self.flush()
+
+
+metrics = Metrics()
@@ -0,0 +1,83 @@
+from math import ceil
+from time import time
+import json
+
+from .cache import CacheBackend, LRUTTLCache, create_backend
+from .utils import RateLimitError
+
+
+def parse_limit(limit: str) -> tuple:
+    """'<requests per second>/<burst>' -> (rate, burst)"""
+    rate, burst = limit.split('/')
+    return float(rate), float(burst)
+
+
+class TokenBucket:
+    """Refill of `rate` tokens per second up to `burst`, a request takes one token"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def ttl(self) -> float:
+        #  a bucket left alone this long is full again, forgetting it changes nothing
+        return self.burst / self.rate + 1
+
+    def take(self, state):
+        now = time()
+        tokens, updated, _ = state or (self.burst, now, True)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return [tokens - 1, now, True]
+        return [tokens, now, False]
+
+    def retry_after(self, tokens: float) -> int:
+        return max(1, ceil((1 - tokens) / self.rate))
+
+
+class RateLimiter:
+    """Token buckets of devices and users in the backend picked by RATE_LIMIT_BACKEND"""
+
+    def __init__(self):
+        self.enabled = False
+        self.backend: CacheBackend = LRUTTLCache()
+        self.device_bucket = TokenBucket(500, 1000)
+        self.user_bucket = TokenBucket(50, 100)
+        self.device_overrides = dict()
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        if not self.enabled:
+            return
+        if app.config['RATE_LIMIT_BACKEND'] == 'local' and app.config['WORKERS'] > 1:
+            #  a bucket per worker multiplies every limit by the worker count and splits bursts at random
+            raise ValueError(f"RATE_LIMIT_BACKEND: local keeps buckets per worker, "
+                             f"use shared or redis with {app.config['WORKERS']} workers")
+        self.backend = create_backend(app.config['RATE_LIMIT_BACKEND'], app.config, app.config['RATE_LIMIT_PATH'])
+        self.device_bucket = TokenBucket(*parse_limit(app.config['RATE_LIMIT_DEVICE']))
+        self.user_bucket = TokenBucket(*parse_limit(app.config['RATE_LIMIT_USER']))
+        #  keys are device statuses or device ids, an id wins over the status
+        overrides = json.loads(app.config['RATE_LIMIT_DEVICE_OVERRIDES'])
+        self.device_overrides = {str(key): TokenBucket(*parse_limit(limit)) for key, limit in overrides.items()}
+
+    def hit(self, key: str, bucket: TokenBucket) -> None:
+        tokens, _, allowed = self.backend.update(f'ratelimit:{key}', bucket.take, bucket.ttl)
+        if not allowed:
+            raise RateLimitError(f"too many requests of {key.replace(':', ': ')}", 429,
+                                 bucket.retry_after(tokens))
+
+    def check_device(self, device_id: int, device_status: str) -> None:
+        if not self.enabled:
+            return
+        bucket = self.device_overrides.get(str(device_id)) \
+            or self.device_overrides.get(device_status) \
+            or self.device_bucket
+        self.hit(f'device:{device_id}', bucket)
+
+    def check_user(self, user_id: int) -> None:
+        if self.enabled:
+            self.hit(f'user:{user_id}', self.user_bucket)
+
+
+rate_limiter = RateLimiter()
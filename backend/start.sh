@@ -1 +1 @@
-gunicorn -w $WORKERS -b 0.0.0.0:$PORT --reload backend.run:app
\ No newline at end of file
+gunicorn -c backend/gunicorn.conf.py backend.run:app
\ No newline at end of file
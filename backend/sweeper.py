@@ -0,0 +1,30 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from time import sleep
+import click
+
+
+def sweep(model, batch_size: int) -> int:
+    total = 0
+    while True:
+        deleted = model.delete_expired(batch_size)
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+@click.command('sweep-tokens')
+@click.option('--batch-size', type=int, default=None, help='rows deleted per transaction [TOKEN_SWEEP_BATCH_SIZE]')
+@click.option('--interval', type=float, default=0, help='keep sweeping every INTERVAL seconds, 0 sweeps once')
+@with_appcontext
+def sweep_tokens(batch_size: int, interval: float):
+    """Deletes lapsed sessions and revocations in short batches, so no long lock is held on the tables"""
+    from .auth.models import Token, RevokedToken
+    batch_size = batch_size or current_app.config['TOKEN_SWEEP_BATCH_SIZE']
+    while True:
+        tokens = sweep(Token, batch_size)
+        revoked = sweep(RevokedToken, batch_size)
+        click.echo(f"deleted {tokens} expired tokens and {revoked} expired revocations")
+        if not interval:
+            return
+        sleep(interval)
@@ -1,9 +1,12 @@
 from flask_mail import Message, Mail
-from flask import current_app
+from flask import current_app, request, Response, stream_with_context
+from werkzeug.http import http_date
+from datetime import datetime
+import hashlib
 import json
 from os import getenv
 from werkzeug.exceptions import UnprocessableEntity
-from functools import wraps
+from functools import wraps, lru_cache
 from dataclasses import dataclass
 
 
@@ -80,8 +83,21 @@ class RecipeError(Exception):
     code: int = 400
 
 
+@dataclass
+class HashingError(Exception):
+    message: str = 'some problem with password hashing'
+    code: int = 503
+
+
+@dataclass
+class RateLimitError(Exception):
+    message: str = 'too many requests'
+    code: int = 429
+    retry_after: int = 1
+
+
 ERRORS = (
-    UserError, AdminError, DeviceError, TokenError, MailError, RecipeError
+    UserError, AdminError, DeviceError, TokenError, MailError, RecipeError, HashingError
 )
 
 
@@ -90,6 +106,9 @@ def error_handler(func):
     def decorator(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except RateLimitError as err:
+            current_app.logger.warning(err.message)
+            return {'message': err.message}, err.code, {'Retry-After': str(err.retry_after)}
         except ERRORS as err:
             current_app.logger.error(err.message)
             return {'message': err.message}, err.code
@@ -114,6 +133,83 @@ def ep_responses(responses: list) -> dict:
     return prepared_responses
 
 
+def chunked(iterable, size: int):
+    chunk = list()
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def get_schema(schema: type, many: bool = False):
+    """Shared schema instance, building one costs far more than dumping a row with it"""
+    return schema(many=many)
+
+
+def dump(schema: type, obj, many: bool = False):
+    """Serializes ORM rows (or Row tuples) straight into JSON-ready data"""
+    return get_schema(schema, many).dump(obj)
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(etag: str, last_modified: datetime = None) -> Response:
+    """304 response if the client copy is still fresh, None otherwise"""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified.replace(microsecond=0) <= request.if_modified_since)
+    if not fresh:
+        return None
+    return Response(status=304, headers=validators(etag, last_modified))
+
+
+def validators(etag: str, last_modified: datetime = None) -> dict:
+    headers = {'ETag': f'"{etag}"'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def streaming_requested() -> bool:
+    if request.args.get('stream', '').lower() == 'true':
+        return True
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_json(key: str, rows, schema: type) -> Response:
+    """Sends `rows` one by one as NDJSON lines or as a {key: [...]} JSON document"""
+    serializer = get_schema(schema)
+
+    if request.accept_mimetypes.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+        def generate():
+            for row in rows:
+                yield json.dumps(serializer.dump(row)) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield '{"%s": [' % key
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(serializer.dump(row))
+            separator = ','
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype=JSON_MIMETYPE)
+
+
 mail = Mail()
 
 
@@ -0,0 +1,74 @@
+"""hey-like load of one URL from keep-alive client threads, for machines without hey
+
+    python -m bench.load http://localhost:5000/api/recipes -z 30 -c 50 -H "X-API-Key: <key>"
+
+Prints requests per second, average and 99th percentile latency and the status code counts.
+The client shares the CPU with the server when both run on one machine, compare modes on the same box.
+"""
+from collections import Counter
+from http.client import HTTPConnection, HTTPException
+from threading import Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+import argparse
+
+
+def worker(url, method: str, headers: dict, body: str, deadline: float, latencies: list, codes: Counter) -> None:
+    connection = None
+    path = url.path + (f'?{url.query}' if url.query else '')
+    while perf_counter() < deadline:
+        if connection is None:
+            connection = HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        started = perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            codes[response.status] += 1
+        except (OSError, HTTPException) as error:
+            codes[type(error).__name__] += 1
+            connection.close()
+            connection = None
+            continue
+        latencies.append(perf_counter() - started)
+    if connection is not None:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('url')
+    parser.add_argument('-z', type=float, default=30, help='duration, seconds')
+    parser.add_argument('-c', type=int, default=50, help='concurrent connections')
+    parser.add_argument('-m', default='GET', help='method')
+    parser.add_argument('-d', default=None, help='form encoded body')
+    parser.add_argument('-H', action='append', default=[], help='header, "Name: value"')
+    options = parser.parse_args()
+
+    headers = dict(header.split(': ', 1) for header in options.H)
+    if options.d is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    latencies, codes = [], Counter()
+    deadline = perf_counter() + options.z
+    threads = [
+        Thread(target=worker, args=(urlsplit(options.url), options.m, headers, options.d, deadline, latencies, codes))
+        for _ in range(options.c)
+    ]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    latencies.sort()
+    print(f'  Requests/sec:\t{len(latencies) / elapsed:.1f}')
+    if latencies:
+        print(f'  Average:\t{sum(latencies) / len(latencies):.4f} secs')
+        print(f'  99% in {latencies[int(len(latencies) * 0.99) - 1]:.4f} secs')
+    for code, count in sorted(codes.items(), key=str):
+        print(f'  [{code}]\t{count} responses')
+
+
+if __name__ == '__main__':
+    main()
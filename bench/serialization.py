@@ -0,0 +1,62 @@
+"""Per-row cost of serializing recipes the old way and with utils.dump
+
+    python -m bench.serialization --rows 1000 --repeat 20
+
+The old way built the `info` dict of every row, load()-ed it through the response schema,
+reparsing its DateTime, and dumped the result again in marshal_with with a fresh schema.
+utils.dump reads the rows once with a cached schema instance.
+
+Runs from the repository root with the backend requirements installed, no database is needed:
+rows are transient Recipe instances.
+"""
+from datetime import datetime, timedelta, timezone
+from timeit import repeat
+from sqlalchemy.orm import configure_mappers
+import argparse
+
+from backend.main.models import Recipe, RecipeComplexity
+from backend.main.schemas import RecipeSchema
+from backend.utils import dump
+
+
+def make_rows(count: int) -> list:
+    configure_mappers()
+    started = datetime.now(timezone.utc)
+    rows = list()
+    for n in range(count):
+        recipe = Recipe.__mapper__.class_manager.new_instance()
+        recipe.id = n + 1
+        recipe.user_id = n % 100 + 1
+        recipe.title = f'dish {n}'
+        recipe.description = f'description of dish {n}'
+        recipe.complexity = list(RecipeComplexity)[n % 3]
+        recipe.cooking_time = n % 120
+        recipe.instruction = f'instruction of dish {n}'
+        recipe.time_created = started - timedelta(seconds=n)
+        rows.append(recipe)
+    return rows
+
+
+def load_and_dump(rows: list) -> list:
+    return [RecipeSchema().dump(RecipeSchema().load(row.info)) for row in rows]
+
+
+def dump_once(rows: list) -> list:
+    return dump(RecipeSchema, rows, many=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+
+    rows = make_rows(options.rows)
+    assert load_and_dump(rows[:10]) == dump_once(rows[:10])
+    for name, serialize in (('load + dump', load_and_dump), ('utils.dump', dump_once)):
+        best = min(repeat(lambda: serialize(rows), number=1, repeat=options.repeat))
+        print(f'{name:12} {best / options.rows * 1e6:8.2f} us per row')
+
+
+if __name__ == '__main__':
+    main()
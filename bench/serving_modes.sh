@@ -0,0 +1,29 @@
+#!/bin/sh
+#  Load of one read endpoint under every SERVER_MODE of backend/gunicorn.conf.py
+#
+#    API_KEY=<device key> AUTH_KEY=<access token> sh bench/serving_modes.sh [duration] [concurrency]
+#
+#  Needs docker compose, the dev database must be up and seeded. Load comes from hey
+#  (https://github.com/rakyll/hey) when it is installed, from python -m bench.load otherwise.
+set -eu
+
+DURATION=${1:-30s}
+CONCURRENCY=${2:-200}
+URL=${URL:-http://localhost:5000/api/recipes}
+: "${API_KEY:?set API_KEY to a device key}"
+: "${AUTH_KEY:?set AUTH_KEY to an access token}"
+
+if command -v hey > /dev/null; then
+    load() { hey -z "$DURATION" -c "$CONCURRENCY" "$@"; }
+else
+    load() { python -m bench.load -z "${DURATION%s}" -c "$CONCURRENCY" "$@"; }
+fi
+
+for mode in sync threads gevent; do
+    SERVER_MODE=$mode docker compose up -d --force-recreate dev_backend_local > /dev/null
+    until curl -s -o /dev/null "$URL"; do sleep 1; done
+
+    echo "== SERVER_MODE=$mode"
+    load -H "X-API-Key: $API_KEY" -H "X-AUTH-Key: $AUTH_KEY" "$URL" \
+        | grep -E 'Requests/sec|Average|99% in|\[[0-9A-Za-z]+\]'
+done
@@ -0,0 +1,137 @@
+from os import environ
+import pytest
+
+if not environ.get('TEST_DB'):
+    pytest.skip('TEST_DB is not set, the tests need a disposable Postgres database', allow_module_level=True)
+
+from sqlalchemy import event, text
+from backend.database import db
+from backend.cache import cache
+
+
+class Statements:
+    """Statements and commits the engine runs inside the block"""
+
+    def __init__(self):
+        self.executed = list()
+        self.commits = 0
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(db.engine, 'commit', self.commit)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.remove(db.engine, 'commit', self.commit)
+
+    @property
+    def count(self) -> int:
+        return len(self.executed)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.executed.append(statement)
+
+    def commit(self, conn):
+        self.commits += 1
+
+
+def reset_schema() -> None:
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.drop_all(bind=None)
+    db.create_all(bind=None)
+    cache.clear()
+
+
+def execute(statement: str, **params) -> list:
+    rows = db.session.execute(text(statement), params)
+    result = rows.all() if rows.returns_rows else []
+    db.session.commit()
+    return result
+
+
+def seed_users(count: int) -> list:
+    return [_id for _id, in execute("""
+        INSERT INTO users (first_name, last_name, username, sex, birth_date, email, hash, status)
+        SELECT 'first', 'last', 'user_' || n, 'MALE', DATE '1990-01-01', 'user_' || n || '@example.com', 'x',
+               'CONFIRMED'
+        FROM generate_series((SELECT coalesce(max(id), 0) FROM users) + 1,
+                             (SELECT coalesce(max(id), 0) FROM users) + :count) AS n
+        RETURNING id
+    """, count=count)]
+
+
+def seed_admins(count: int, devices: int) -> list:
+    """Admins with `devices` devices each, every device holds one live session of its admin"""
+    admin_ids = seed_users(count)
+    execute("INSERT INTO admins (id, status) SELECT unnest(:ids), 'ADMIN'", ids=admin_ids)
+    execute("""
+        INSERT INTO devices (admin_id, name, key, status, requests)
+        SELECT admin_id, 'device-' || admin_id || '-' || n, md5(admin_id || '-' || n), 'ENABLE', 0
+        FROM unnest(:ids) AS admin_id, generate_series(1, :devices) AS n
+    """, ids=admin_ids, devices=devices)
+    execute("""
+        INSERT INTO tokens (device_id, user_id, access_digest, refresh_digest, access_jti, expires,
+                            refresh_expires, status)
+        SELECT id, admin_id, sha256(convert_to('access-' || id, 'UTF8')), sha256(convert_to('refresh-' || id, 'UTF8')),
+               md5('jti-' || id), now() + interval '1 hour', now() + interval '30 days', 'ACTIVE'
+        FROM devices WHERE admin_id = ANY(:ids)
+    """, ids=admin_ids)
+    return admin_ids
+
+
+def seed_revoked_tokens(count: int, active_every: int = 100) -> None:
+    """Mostly lapsed revocations, one in `active_every` is still live"""
+    execute("""
+        INSERT INTO revoked_tokens (jti, expires)
+        SELECT md5('revoked-' || n), CASE WHEN n % :active_every = 0 THEN now() + interval '1 day'
+                                          ELSE now() - interval '1 day' END
+        FROM generate_series(1, :count) AS n
+    """, count=count, active_every=active_every)
+
+
+def seed_recipes(count: int, ingredients: int, per_recipe: int = 5, common: int = 5) -> None:
+    """Recipes of the seeded users with `per_recipe` ingredients each
+
+    The first ingredient of every recipe is one of the `common` ingredients with the highest ids,
+    like salt or water, the others are spread evenly over the rest.
+    """
+    execute("""
+        INSERT INTO ingredients (name) SELECT 'ingredient ' || n FROM generate_series(1, :ingredients) AS n
+    """, ingredients=ingredients)
+    execute("""
+        INSERT INTO recipes (user_id, title, description, complexity, cooking_time, instruction, time_created)
+        SELECT users.first + n % users.total,
+               CASE WHEN n % 500 = 0 THEN 'soup ' ELSE 'dish ' END || n,
+               'description of dish ' || n,
+               (ARRAY['EASY', 'MEDIUM', 'HARD'])[n % 3 + 1]::recipecomplexity,
+               n % 120,
+               'instruction of dish ' || n,
+               now() - n * interval '1 second'
+        FROM generate_series(1, :count) AS n, (SELECT min(id) AS first, count(*) AS total FROM users) AS users
+    """, count=count)
+    execute("""
+        INSERT INTO recipe_ingredients (recipe_id, ingredient_id)
+        SELECT recipes.id, ingredients.first + CASE
+            WHEN k = 1 THEN ingredients.total - 1 - recipes.id % :common
+            ELSE (recipes.id * 7919 + k * 104729) % (ingredients.total - :common) END
+        FROM recipes, generate_series(1, :per_recipe) AS k,
+             (SELECT min(id) AS first, count(*) AS total FROM ingredients) AS ingredients
+        ON CONFLICT DO NOTHING
+    """, per_recipe=per_recipe, common=common)
+    execute("""
+        UPDATE recipes SET ingredients_count = postings.count
+        FROM (SELECT recipe_id, count(*) FROM recipe_ingredients GROUP BY recipe_id) AS postings
+        WHERE postings.recipe_id = recipes.id
+    """)
+    execute("""
+        UPDATE recipe_ingredients SET ingredients_count = recipes.ingredients_count
+        FROM recipes WHERE recipes.id = recipe_ingredients.recipe_id
+    """)
+    execute("""
+        UPDATE ingredients SET recipes_count = postings.count
+        FROM (SELECT ingredient_id, count(*) FROM recipe_ingredients GROUP BY ingredient_id) AS postings
+        WHERE postings.ingredient_id = ingredients.id
+    """)
@@ -0,0 +1,42 @@
+from helpers import Statements, seed_admins
+
+from backend.auth import schemas
+from backend.auth.controllers import AdminController
+from backend.database import db
+from backend.utils import dump
+
+
+def listing_statements() -> int:
+    db.session.remove()
+    with Statements() as statements:
+        dump(schemas.AdminsSchema, AdminController().get_admins_info())
+    return statements.count
+
+
+def test_admins_listing_statements_do_not_grow_with_data(database):
+    seed_admins(3, devices=1)
+    small = listing_statements()
+    seed_admins(200, devices=5)
+    large = listing_statements()
+
+    assert small == large == 1
+
+
+def test_streamed_admins_listing_runs_one_statement(database):
+    seed_admins(200, devices=5)
+    db.session.remove()
+    with Statements() as statements:
+        admins = [dump(schemas.AdminSchema, admin) for admin in AdminController().iter_admins_info(50)]
+
+    assert len(admins) == 200
+    assert statements.count == 1
+
+
+def test_admin_info_counts_devices_in_one_statement(database):
+    admin_id, = seed_admins(1, devices=300)
+    db.session.remove()
+    with Statements() as statements:
+        admin = dump(schemas.AdminSchema, AdminController().get_admin_info(admin_id))
+
+    assert admin['devices'] == 300
+    assert statements.count == 1
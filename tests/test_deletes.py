@@ -0,0 +1,49 @@
+from helpers import Statements, execute, seed_admins
+
+from backend.auth.controllers import AdminController, DeviceController, UserController
+from backend.database import db
+
+
+def count(table: str) -> int:
+    return execute(f"SELECT count(*) FROM {table}")[0][0]
+
+
+def delete_statements(delete, ids: list) -> Statements:
+    db.session.remove()
+    with Statements() as statements:
+        delete(ids)
+    return statements
+
+
+def test_deleting_devices_is_three_statements_and_one_commit(database):
+    device_ids = [_id for _id, in execute("SELECT id FROM devices WHERE admin_id = ANY(:ids)",
+                                          ids=seed_admins(2, devices=2))]
+    small = delete_statements(DeviceController().delete_devices, device_ids)
+    device_ids = [_id for _id, in execute("SELECT id FROM devices WHERE admin_id = ANY(:ids)",
+                                          ids=seed_admins(50, devices=10))]
+    large = delete_statements(DeviceController().delete_devices, device_ids)
+
+    assert small.count == large.count == 3
+    assert small.commits == large.commits == 1
+    assert count('devices') == count('tokens') == 0
+    assert count('revoked_tokens') == 4 + 500
+
+
+def test_deleting_admins_is_four_statements_and_one_commit(database):
+    small = delete_statements(AdminController.delete_admins, seed_admins(2, devices=2))
+    large = delete_statements(AdminController.delete_admins, seed_admins(50, devices=10))
+
+    assert small.count == large.count == 4
+    assert small.commits == large.commits == 1
+    assert count('admins') == count('devices') == count('tokens') == 0
+    assert count('users') == 52
+
+
+def test_deleting_users_is_nine_statements_and_one_commit(database):
+    small = delete_statements(UserController.delete_users, seed_admins(2, devices=2))
+    large = delete_statements(UserController.delete_users, seed_admins(50, devices=10))
+
+    assert small.count == large.count == 9
+    assert small.commits == large.commits == 1
+    assert count('users') == count('admins') == count('devices') == count('tokens') == 0
+    assert count('revoked_tokens') == 4 + 500
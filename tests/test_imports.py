@@ -0,0 +1,60 @@
+from tempfile import TemporaryFile
+import json
+
+from helpers import execute, seed_users
+
+from backend.auth.controllers import UserController
+from backend.auth.models import ImportJob, User
+from backend.database import db
+
+
+class Upload:
+    """Spooled upload recording how many lines the import has read ahead of its inserts"""
+
+    def __init__(self, lines: list):
+        self.file = TemporaryFile()
+        self.file.writelines(lines)
+        self.file.seek(0)
+        self.read = 0
+        self.ahead = list()
+
+    def __iter__(self):
+        for line in self.file:
+            self.read += 1
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+def entry(n: int) -> bytes:
+    return json.dumps({
+        'first_name': 'first', 'last_name': 'last', 'username': f'new_{n}', 'sex': 'male',
+        'birth_date': '1990-01-01', 'email': f'new_{n}@example.com', 'password': 'password1'
+    }).encode() + b'\n'
+
+
+def test_import_reads_the_spooled_upload_one_chunk_at_a_time(database, monkeypatch):
+    admin_id, = seed_users(1)
+    lines = [entry(n) for n in range(10)] + [b'not json\n', entry(0), b'{"username": "x"}\n'] + \
+            [entry(n) for n in range(10, 20)]
+    upload = Upload(lines)
+    insert_many = User.insert_many
+
+    def record_read_ahead(rows):
+        upload.ahead.append(upload.read)
+        return insert_many(rows)
+
+    job_id = ImportJob.create(admin_id, len(lines))
+    monkeypatch.setattr(User, 'insert_many', record_read_ahead)
+    UserController().run_users_import(job_id, upload, 5)
+    db.session.remove()
+
+    job = ImportJob.find_by_id(job_id)
+    assert (job.received, job.uploaded, job.duplicated, job.invalid) == (23, 20, 1, 2)
+    assert upload.ahead == [5, 10, 15, 20, 23]
+    assert upload.file.closed
+    assert execute("SELECT count(*) FROM users")[0][0] == 21
@@ -0,0 +1,91 @@
+import json
+
+from helpers import Statements, execute, seed_recipes, seed_users
+
+from backend.audit import capture_statements, vacuum_analyze
+from backend.database import db
+from backend.main.models import Recipe, Ingredient
+
+RECIPES = 100000
+INGREDIENTS = 2000
+CANDIDATES = 5000
+
+
+def add_recipe(ingredient_ids: list) -> int:
+    (recipe_id,), = execute("""
+        INSERT INTO recipes (user_id, title, description, complexity, cooking_time, instruction, ingredients_count)
+        SELECT min(id), 'staples', 'made of staples', 'EASY', 10, 'mix', :count FROM users RETURNING id
+    """, count=len(ingredient_ids))
+    execute("""
+        INSERT INTO recipe_ingredients (recipe_id, ingredient_id, ingredients_count)
+        SELECT :recipe_id, unnest(:ids), :count
+    """, recipe_id=recipe_id, ids=ingredient_ids, count=len(ingredient_ids))
+    execute("UPDATE ingredients SET recipes_count = recipes_count + 1 WHERE id = ANY(:ids)", ids=ingredient_ids)
+    return recipe_id
+
+
+def pantry(*numbers: int) -> list:
+    return Ingredient.find_ids([f'ingredient {n}' for n in numbers])
+
+
+def seed() -> tuple:
+    """Rare and staple pantry ingredient ids, with a recipe made of two staples only
+
+    Recipes hold 8 ingredients, one of the 5 staples with the highest ids, each in 20000 recipes.
+    """
+    seed_users(100)
+    seed_recipes(RECIPES, ingredients=INGREDIENTS, per_recipe=8)
+    rare, staples = pantry(*range(1, 11)), pantry(*range(INGREDIENTS - 4, INGREDIENTS + 1))
+    staple_recipe = add_recipe(staples[-2:])
+    vacuum_analyze()
+
+    postings, = execute("SELECT count(*) FROM recipe_ingredients WHERE ingredient_id = ANY(:ids)", ids=rare)
+    assert postings[0] <= CANDIDATES
+    postings, = execute("SELECT count(*) FROM recipe_ingredients WHERE ingredient_id = ANY(:ids)", ids=staples)
+    assert postings[0] > CANDIDATES
+    return rare, staples, staple_recipe
+
+
+def ranking(rows: list) -> list:
+    return [(recipe.id, matched, missing) for recipe, matched, missing, coverage in rows]
+
+
+def postings_read(plan: dict) -> int:
+    read = plan['Actual Rows'] * plan['Actual Loops'] if plan.get('Relation Name') == 'recipe_ingredients' else 0
+    return read + sum(postings_read(child) for child in plan.get('Plans', []))
+
+
+def test_recipe_of_staples_ranks_first_above_the_candidate_cap(database):
+    rare, staples, staple_recipe = seed()
+
+    capped = Recipe.find_cookable(rare + staples, limit=20, candidates=CANDIDATES)
+    exact = Recipe.find_cookable(rare + staples, limit=20, candidates=RECIPES * 10)
+
+    assert ranking(capped)[0] == (staple_recipe, 2, 0)
+    assert ranking(capped) == ranking(exact)
+    assert ranking(Recipe.find_cookable(rare + staples, limit=20, offset=20, candidates=CANDIDATES)) == \
+           ranking(Recipe.find_cookable(rare + staples, limit=20, offset=20, candidates=RECIPES * 10))
+
+
+def test_cookable_search_skips_postings_of_staples(database):
+    rare, staples, staple_recipe = seed()
+    #  recipes the pantry covers, they bound the recipes worth reading through the staples
+    for n in range(20):
+        add_recipe([rare[n % len(rare)], rare[(n + 1) % len(rare)], staples[n % len(staples)]])
+    vacuum_analyze()
+
+    db.session.remove()
+    with Statements() as statements:
+        found = Recipe.find_cookable(rare + staples, limit=10, candidates=CANDIDATES)
+    assert statements.count == 3
+    assert [missing for _, _, missing, _ in found] == [0] * 10
+    assert ranking(found) == ranking(Recipe.find_cookable(rare + staples, limit=10, candidates=RECIPES * 10))
+
+    connection = db.session.connection()
+    read = 0
+    for statement, parameters in capture_statements(Recipe.find_cookable, (rare + staples, 10), {}):
+        result = connection.exec_driver_sql(f'EXPLAIN (ANALYZE, FORMAT JSON) {statement}', parameters).scalar()
+        read += postings_read((json.loads(result) if isinstance(result, str) else result)[0]['Plan'])
+    db.session.rollback()
+    staple_postings, = execute("SELECT count(*) FROM recipe_ingredients WHERE ingredient_id = ANY(:ids)", ids=staples)
+    assert read < staple_postings[0] // 2
@@ -0,0 +1,20 @@
+from helpers import seed_admins, seed_recipes, seed_revoked_tokens, seed_users
+
+from backend.audit import explain_lookups, table_rows, vacuum_analyze
+
+MIN_ROWS = 10000
+
+
+def test_hot_lookups_do_not_scan_large_tables(database):
+    seed_users(MIN_ROWS)
+    seed_admins(100, devices=MIN_ROWS // 100)
+    seed_revoked_tokens(2 * MIN_ROWS)
+    seed_recipes(2 * MIN_ROWS, ingredients=MIN_ROWS + 1000)
+    vacuum_analyze()
+
+    sizes = table_rows()
+    for table in ('users', 'devices', 'tokens', 'revoked_tokens', 'recipes', 'ingredients', 'recipe_ingredients'):
+        assert sizes[table] >= MIN_ROWS, table
+
+    scans = [(name, tables) for name, tables in explain_lookups(MIN_ROWS) if tables]
+    assert scans == []
@@ -0,0 +1,80 @@
+import pytest
+from werkzeug.test import Client
+
+from helpers import execute, seed_admins
+
+from backend.auth.controllers import TokenController
+from backend.auth.models import User
+from backend.cache import token_deny_list
+from backend.counters import request_counter
+from backend.database import db, REPLICA_BIND, PRIMARY_COOKIE
+
+RECIPE = {'title': 'fresh dish', 'description': 'just written', 'complexity': 'easy', 'cooking_time': 10,
+          'instruction': 'mix'}
+
+
+@pytest.fixture
+def replica(database, app):
+    """Replica bind with the schema and none of the rows, every write is still on its way"""
+    engine = db.get_engine(app, bind=REPLICA_BIND)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.Model.metadata.drop_all(engine)
+    db.Model.metadata.create_all(engine)
+    token_deny_list.init_app(app, 'JWT_DENY_LIST')
+    yield engine
+    token_deny_list.init_app(app, 'JWT_DENY_LIST')
+    #  device requests of the test, written now rather than at exit
+    request_counter.flush()
+
+
+def open_client(app) -> Client:
+    #  werkzeug's own client, the flask 2.0 wrapper passes arguments werkzeug 2.1+ dropped
+    return Client(app, app.response_class)
+
+
+def seed_session() -> tuple:
+    """Device key and access token of a session stored on the primary only"""
+    admin_id, = seed_admins(1, devices=1)
+    (device_id, key), = execute("SELECT id, key FROM devices WHERE admin_id = :id", id=admin_id)
+    return admin_id, device_id, {'X-Api-Key': key, 'X-Auth-Key': f'access-{device_id}'}
+
+
+def test_reads_follow_a_write_to_the_primary_while_the_cookie_is_held(replica, app):
+    _, _, headers = seed_session()
+    client = open_client(app)
+
+    created = client.post('/api/recipe', data=RECIPE, headers=headers)
+    assert created.status_code == 201
+    assert PRIMARY_COOKIE in created.headers['Set-Cookie']
+
+    path = f"/api/recipe/{created.get_json()['id']}"
+    assert client.get(path, headers=headers).status_code == 200
+    client.cookie_jar.clear()
+    assert client.get(path, headers=headers).status_code == 404
+
+
+def test_new_session_authenticates_on_a_lagging_replica(replica, app):
+    _, _, headers = seed_session()
+
+    response = open_client(app).get('/api/users', headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['users'] == []
+
+
+def test_revoked_token_is_refused_on_a_lagging_replica(replica, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JWT_STATELESS', True)
+    user_id, device_id, headers = seed_session()
+    access, _ = TokenController.create_token(User.find_by_id(user_id), device_id)
+    db.session.commit()
+    headers['X-Auth-Key'] = access['access_token']
+    client = open_client(app)
+    assert client.get('/api/users', headers=headers).status_code == 200
+
+    #  revoked by another worker, this one learns it from the table on its next reload
+    execute("INSERT INTO revoked_tokens (jti, expires) SELECT access_jti, expires FROM tokens WHERE user_id = :id",
+            id=user_id)
+    token_deny_list.init_app(app, 'JWT_DENY_LIST')
+
+    assert client.get('/api/users', headers=headers).status_code == 401
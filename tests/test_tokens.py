@@ -0,0 +1,43 @@
+from helpers import seed_admins
+
+from backend.auth.controllers import AdminController, TokenController, UserController
+from backend.auth.models import User
+from backend.database import db
+
+
+def login(user_id: int) -> tuple:
+    device_id = db.session.execute("SELECT min(id) FROM devices WHERE admin_id = :id", {'id': user_id}).scalar()
+    access, refresh = TokenController.create_token(User.find_by_id(user_id), device_id)
+    db.session.commit()
+    return access['access_token'], refresh, device_id
+
+
+def test_stateless_check_rejects_a_refresh_token(database):
+    access_token, refresh_token, device_id = login(*seed_admins(1, devices=1))
+
+    assert TokenController.check_access_claims(access_token, device_id)['status']
+    checking = TokenController.check_access_claims(refresh_token, device_id)
+    assert (checking['status'], checking['code']) == (False, 401)
+
+
+def test_freezing_a_user_revokes_the_access_token_it_holds(database):
+    user_id, = seed_admins(1, devices=1)
+    access_token, _, device_id = login(user_id)
+
+    UserController().freeze_account(User.find_by_id(user_id).email)
+    db.session.commit()
+
+    checking = TokenController.check_access_claims(access_token, device_id)
+    assert (checking['status'], checking['code']) == (False, 401)
+
+
+def test_changing_admin_rights_revokes_the_access_token_with_the_old_role(database):
+    user_id, = seed_admins(1, devices=1)
+    access_token, _, device_id = login(user_id)
+    assert TokenController.check_access_claims(access_token, device_id)['identity'].role == 'admin'
+
+    AdminController().create_admin(user_id, 'moder')
+    db.session.commit()
+
+    checking = TokenController.check_access_claims(access_token, device_id)
+    assert (checking['status'], checking['code']) == (False, 401)